@@ -1,9 +1,11 @@
 import os
+import asyncio
 import logging
-import threading
-import time
-from telegram_bot import run_bot
-from price_monitor import PriceMonitor
+from telegram_bot import run_bot, price_monitor
+from price_monitor import POLL_TIERS, TG_CHAT_ID, DIGEST_TYPES, DIGEST_WINDOW, OUTBOX_RESUBMIT_INTERVAL, format_notification, format_digest_line
+from digest import DigestBuffer
+from scheduler import PollScheduler
+from notifier import NotificationQueue
 
 # Configure logging
 logging.basicConfig(
@@ -12,58 +14,86 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def run_price_monitor():
-    """Run the price monitor in a separate thread"""
-    monitor = PriceMonitor()
+async def run_price_monitor(application):
+    """Run the price monitor as a task on the bot's event loop"""
+    # Share the bot's monitor so commands and evaluation see the same in-memory watchlist
+    monitor = price_monitor
+    write_behind = asyncio.create_task(monitor.run_write_behind())
+
+    async def deliver(notif):
+        if not await monitor.send_telegram_notification_async(application.bot, format_notification(notif)):
+            return False
+        monitor.mark_sent(notif)
+        return True
+
+    # Sender tasks deliver through the running bot, decoupled from evaluation
+    notification_queue = NotificationQueue(deliver, chat_id=TG_CHAT_ID, on_failed=monitor.mark_failed)
+    notification_queue.start()
+    # Coalesces the configured notification types into digest messages
+    digest = DigestBuffer(DIGEST_TYPES, DIGEST_WINDOW, format_digest_line)
+
+    # Resend alerts whose anchors were saved but which never reached Telegram
+    for notif in monitor.open_outbox():
+        notification_queue.submit(notif)
     logger.info("Price monitoring started")
-    
+
+    scheduler = PollScheduler(POLL_TIERS)
+    loop = asyncio.get_running_loop()
+    last_resubmit = loop.time()
+
     try:
         while True:
-            notifications = monitor.check_price_movements()
-            if notifications:
-                for notif in notifications:
-                    # Different message format based on notification type
-                    if notif["type"] == "absolute":
-                        # Absolute change notification without time
-                        direction = "up" if notif["price_change"] > 0 else "down"
-                        message = (
-                            f"{notif['coin_name']} ({notif['coin_symbol']}) {direction} by {abs(notif['price_change']):.2f}%\n"
-                            f"Current price: ${notif['current_price']:.4f}"
-                        )
-                    else:
-                        # Short-term or long-term notification with time
-                        hours = notif["time_elapsed"].total_seconds() / 3600
-                        time_str = (
-                            f"{int(hours)} hours" if hours >= 1
-                            else f"{int(notif['time_elapsed'].total_seconds() / 60)} minutes"
-                        )
-                        
-                        direction = "up" if notif["price_change"] > 0 else "down"
-                        
-                        message = (
-                            f"{notif['coin_name']} ({notif['coin_symbol']}) {direction} by {abs(notif['price_change']):.2f}% in {time_str}\n"
-                            f"Current price: ${notif['current_price']:.4f}"
-                        )
-                    
-                    # Send to Telegram
-                    monitor.send_telegram_notification(message)
-            
-            # Sleep for the configured interval
-            time.sleep(60)  # Check every minute
-            
-    except Exception as e:
-        logger.error(f"💥❌⚠️ MONITOR ERROR ⚠️❌💥 Error in price monitor: {e}")
+            # Wait for the next aligned deadline instead of sleeping a fixed interval after each cycle
+            due_tiers = await scheduler.wait_async()
+            try:
+                coin_ids = monitor.coins_due(due_tiers)
+                notifications = await monitor.check_price_movements_async(coin_ids) if coin_ids else []
+                messages = digest.add(notifications)
+                if digest.ready():
+                    messages += digest.take()
+                for message in messages:
+                    notification_queue.submit(message)
+                if messages:
+                    stats = notification_queue.stats
+                    logger.info(
+                        f"Queued {len(messages)} messages for {len(notifications)} notifications, "
+                        f"{notification_queue.depth()} waiting (overflowed {stats['overflowed']}, outboxed {stats['outboxed']}, dropped {stats['dropped']})"
+                    )
+                # Give alerts the notifier gave up on, or left in the outbox when it overflowed, another run
+                if loop.time() - last_resubmit >= OUTBOX_RESUBMIT_INTERVAL:
+                    resubmitted = notification_queue.submit_pending(monitor.unsent_notifications(digest.pending))
+                    if resubmitted:
+                        logger.info(f"Re-submitted {resubmitted} unsent notifications from the outbox")
+                    last_resubmit = loop.time()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"💥❌⚠️ MONITOR ERROR ⚠️❌💥 Error in price monitor: {e}")
+
+    except asyncio.CancelledError:
+        logger.info("Price monitoring stopped")
+        raise
+    finally:
+        # Deliver what is still queued while the bot can send
+        for message in digest.take():
+            notification_queue.submit(message)
+        await notification_queue.close()
+        write_behind.cancel()
+        try:
+            await write_behind
+        except asyncio.CancelledError:
+            pass
+        # A restarted monitor opens the outbox again and replays what is still unsent
+        monitor.close_outbox()
+        await monitor.cmc.aclose()
 
 def main():
     """Main entry point for the application"""
     logger.info("Starting cryptocurrency price monitoring application")
-    
-    # Start price monitor in a separate thread
-    price_thread = threading.Thread(target=run_price_monitor, daemon=True)
-    price_thread.start()
-    
-    # Run the Telegram bot in the main thread
-    run_bot()
+
+    # Run the Telegram bot in the main thread, with the price monitor on its event loop
+    run_bot(background_task=run_price_monitor)
+    price_monitor.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,120 @@
+import time
+import logging
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict
+from credit_budget import CMCRateLimitError
+
+logger = logging.getLogger(__name__)
+
+CMC_BASE_URL = "https://pro-api.coinmarketcap.com/v1"
+CMC_POOL_SIZE = 10
+CMC_CONNECT_TIMEOUT = 5
+CMC_READ_TIMEOUT = 20
+
+class CMCClient:
+    """Pooled keep-alive HTTP session shared by every CoinMarketCap call"""
+
+    def __init__(self, api_key: str, base_url: str = CMC_BASE_URL, pool_size: int = CMC_POOL_SIZE,
+                 connect_timeout: float = CMC_CONNECT_TIMEOUT, read_timeout: float = CMC_READ_TIMEOUT, budget=None):
+        self.base_url = base_url
+        self.budget = budget
+        self.timeout = (connect_timeout, read_timeout)
+
+        # Headers are built once and sent with every request on this session
+        self.session = requests.Session()
+        self.session.headers.update({
+            'X-CMC_PRO_API_KEY': api_key,
+            'Accept': 'application/json',
+            'Accept-Encoding': 'deflate, gzip',
+            'Connection': 'keep-alive'
+        })
+
+        # Retries are handled by the callers, the adapter only pools connections
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # The async transport is created lazily on the event loop that first uses it
+        self.pool_size = pool_size
+        self.async_session = None
+
+        self._stats_lock = threading.Lock()
+        self.latency_stats = {}
+
+    def get(self, path: str, params: Dict = None) -> Dict:
+        """GET an endpoint relative to the base URL and return the decoded JSON body"""
+        start = time.perf_counter()
+        try:
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+            data = self._account(response.status_code, response.json())
+        except Exception:
+            self._record(path, time.perf_counter() - start, failed=True)
+            raise
+        self._record(path, time.perf_counter() - start)
+        return data
+
+    async def get_async(self, path: str, params: Dict = None) -> Dict:
+        """Async counterpart of get, sharing headers, timeouts and latency counters"""
+        if self.async_session is None:
+            self.async_session = httpx.AsyncClient(
+                headers=dict(self.session.headers),
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            )
+        start = time.perf_counter()
+        try:
+            response = await self.async_session.get(f"{self.base_url}{path}", params=params)
+            data = self._account(response.status_code, response.json())
+        except Exception:
+            self._record(path, time.perf_counter() - start, failed=True)
+            raise
+        self._record(path, time.perf_counter() - start)
+        return data
+
+    def _account(self, status_code: int, data: Dict) -> Dict:
+        """Charge the call to the credit budget and turn 429s into CMCRateLimitError"""
+        status = data.get('status') or {}
+        if status_code == 429:
+            error = CMCRateLimitError(status.get('error_code'), status.get('error_message'))
+            if self.budget is not None:
+                self.budget.rate_limited(error)
+            raise error
+        if self.budget is not None:
+            self.budget.record(int(status.get('credit_count') or 0))
+        return data
+
+    async def aclose(self):
+        if self.async_session is not None:
+            await self.async_session.aclose()
+            self.async_session = None
+
+    def _record(self, path: str, elapsed: float, failed: bool = False):
+        with self._stats_lock:
+            stats = self.latency_stats.setdefault(path, {
+                "requests": 0,
+                "errors": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "last_seconds": 0.0
+            })
+            stats["requests"] += 1
+            if failed:
+                stats["errors"] += 1
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+            stats["last_seconds"] = elapsed
+
+    def get_latency_stats(self) -> Dict[str, Dict]:
+        """Return a snapshot of the per-endpoint latency counters"""
+        with self._stats_lock:
+            snapshot = {}
+            for path, stats in self.latency_stats.items():
+                snapshot[path] = dict(stats)
+                snapshot[path]["avg_seconds"] = stats["total_seconds"] / stats["requests"] if stats["requests"] else 0.0
+            return snapshot
+
+    def close(self):
+        self.session.close()
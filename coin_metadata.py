@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILE = "coin_map.json"
+METADATA_TTL = 86400  # seconds before the map is fetched again
+MAP_PAGE_SIZE = 5000
+METADATA_RETRY = 300  # seconds between attempts after a failed fetch
+FUZZY_MIN_SIMILARITY = 0.5  # share of the query's trigrams a fuzzy match must contain
+# Prefixes this short match thousands of keys, so their best ranked coins are kept ready
+SHORT_PREFIX_LENGTH = 2
+SHORT_PREFIX_TOP = 50
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _rank(coin: Dict) -> float:
+    return coin.get("rank") or float('inf')
+
+class CoinMetadata:
+    """Local copy of CoinMarketCap's /cryptocurrency/map, indexed by id, symbol, slug and name.
+
+    Nothing is loaded until the first lookup. The map is read from the cache file while it
+    is younger than the TTL, otherwise fetched page by page and written back. When a refresh
+    fails the stale copy keeps serving lookups.
+    """
+
+    def __init__(self, cmc, path: str = METADATA_FILE, ttl: float = METADATA_TTL):
+        self.cmc = cmc
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.fetched_at = None
+        self.retry_at = 0.0
+        self.by_id = {}
+        self.by_symbol = {}
+        self.by_slug = {}
+        self.by_name = {}
+        # Search indexes: sorted (key, rank, id) for prefix bisection, the best (rank, id) per
+        # short prefix, and trigram posting lists
+        self.prefix_keys = []
+        self.short_prefixes = {}
+        self.trigrams = {}
+
+    def _index(self, coins: List[Dict]):
+        by_id, by_symbol, by_slug, by_name = {}, {}, {}, {}
+        # Lower rank first, so a shared symbol resolves to the biggest coin
+        prefix_keys, trigrams = [], {}
+        for coin in sorted(coins, key=_rank):
+            by_id[coin["id"]] = coin
+            by_symbol.setdefault(coin["symbol"].upper(), []).append(coin)
+            by_slug.setdefault(coin["slug"], coin)
+            by_name.setdefault(coin["name"].lower(), coin)
+            for key in self._search_keys(coin):
+                prefix_keys.append((key, _rank(coin), coin["id"]))
+            for gram in _trigrams(f"{coin['symbol']} {coin['name']}".lower()):
+                trigrams.setdefault(gram, []).append(coin["id"])
+        prefix_keys.sort()
+        short_prefixes = {}
+        for coin in sorted(coins, key=lambda c: (_rank(c), c["id"])):
+            self._add_short_prefixes(short_prefixes, coin)
+        self.by_id, self.by_symbol, self.by_slug, self.by_name = by_id, by_symbol, by_slug, by_name
+        self.prefix_keys, self.short_prefixes, self.trigrams = prefix_keys, short_prefixes, trigrams
+
+    @classmethod
+    def _add_short_prefixes(cls, short_prefixes: Dict, coin: Dict):
+        """Keep coin among the SHORT_PREFIX_TOP best ranked for each short prefix of its keys"""
+        entry = (_rank(coin), coin["id"])
+        prefixes = {key[:length] for key in cls._search_keys(coin) for length in range(1, SHORT_PREFIX_LENGTH + 1)}
+        for prefix in prefixes:
+            best = short_prefixes.setdefault(prefix, [])
+            if len(best) < SHORT_PREFIX_TOP or entry < best[-1]:
+                insort(best, entry)
+                del best[SHORT_PREFIX_TOP:]
+
+    @staticmethod
+    def _search_keys(coin: Dict) -> set:
+        """Prefix keys for a coin: its symbol, full name and each word of the name"""
+        name = coin["name"].lower()
+        return {coin["symbol"].lower(), name, *name.split()}
+
+    def _load_file(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._index(data["coins"])
+            self.fetched_at = data["fetched_at"]
+            logger.info(f"Loaded metadata for {len(self.by_id)} coins from {self.path}")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading coin metadata: {e}")
+            return False
+
+    def _fetch(self):
+        coins = []
+        start = 1
+        while True:
+            data = self.cmc.get("/cryptocurrency/map", params={'start': start, 'limit': MAP_PAGE_SIZE})
+            if data.get('status', {}).get('error_code', 0) != 0:
+                raise RuntimeError(data['status']['error_message'])
+            page = data.get('data') or []
+            coins.extend(
+                {"id": c["id"], "name": c["name"], "symbol": c["symbol"], "slug": c["slug"], "rank": c.get("rank")}
+                for c in page
+            )
+            if len(page) < MAP_PAGE_SIZE:
+                break
+            start += MAP_PAGE_SIZE
+
+        self._index(coins)
+        self.fetched_at = time.time()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": self.fetched_at, "coins": coins}, f)
+        os.replace(tmp_path, self.path)
+        logger.info(f"Fetched metadata for {len(coins)} coins from CoinMarketCap")
+
+    def _ensure(self):
+        """Load or refresh the map when it is missing or older than the TTL"""
+        with self._lock:
+            if self.fetched_at is None:
+                self._load_file()
+            if self.fetched_at is not None and time.time() - self.fetched_at < self.ttl:
+                return
+            if time.time() < self.retry_at:
+                return
+            try:
+                self._fetch()
+            except Exception as e:
+                # Lookups keep using whatever copy is loaded until the next attempt
+                logger.error(f"Error fetching coin metadata: {e}")
+                self.retry_at = time.time() + METADATA_RETRY
+
+    def get(self, coin_id: int) -> Optional[Dict]:
+        self._ensure()
+        return self.by_id.get(coin_id)
+
+    def remember(self, coin_id: int, name: str, symbol: str):
+        """Add a coin resolved elsewhere, such as a listing newer than the cached map"""
+        with self._lock:
+            if coin_id not in self.by_id:
+                coin = {"id": coin_id, "name": name, "symbol": symbol, "slug": name.lower().replace(' ', '-'), "rank": None}
+                self.by_id[coin_id] = coin
+                self.by_symbol.setdefault(symbol.upper(), []).append(coin)
+                for key in self._search_keys(coin):
+                    insort(self.prefix_keys, (key, _rank(coin), coin_id))
+                self._add_short_prefixes(self.short_prefixes, coin)
+                for gram in _trigrams(f"{symbol} {name}".lower()):
+                    self.trigrams.setdefault(gram, []).append(coin_id)
+
+    def resolve(self, query: str, fuzzy: bool = True) -> Optional[int]:
+        """Coin id for a numeric id, slug, symbol or name, falling back to the closest search match if fuzzy"""
+        query = query.strip()
+        if query.isdigit():
+            return int(query)
+        self._ensure()
+        lowered = query.lower()
+        symbol_matches = self.by_symbol.get(query.upper()) or [None]
+        candidates = [c for c in (self.by_slug.get(lowered), self.by_name.get(lowered), symbol_matches[0]) if c]
+        if not candidates:
+            if not fuzzy:
+                return None
+            # Tolerate typos and partial names by taking the best search hit
+            matches = self.search(query, 1)
+            return matches[0]["id"] if matches else None
+        # "bitcoin" is also some token's symbol, so the best ranked match wins
+        return min(candidates, key=lambda c: c.get("rank") or float('inf'))["id"]
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        """Coins matching query exactly, by prefix, then by trigram similarity, each group by market cap rank"""
+        self._ensure()
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        found = {}
+        exact = [self.by_slug.get(query), self.by_name.get(query), *self.by_symbol.get(query.upper(), [])]
+        for coin in sorted((c for c in exact if c), key=_rank):
+            found.setdefault(coin["id"], coin)
+
+        if len(query) <= SHORT_PREFIX_LENGTH and limit <= SHORT_PREFIX_TOP:
+            # The first limit entries already fill the results, whatever the exact hits took
+            prefixed = self.short_prefixes.get(query, [])
+        else:
+            # Keys sharing the prefix are contiguous in the sorted list
+            prefixed = []
+            index = bisect_left(self.prefix_keys, (query,))
+            while index < len(self.prefix_keys) and self.prefix_keys[index][0].startswith(query):
+                _, rank, coin_id = self.prefix_keys[index]
+                prefixed.append((rank, coin_id))
+                index += 1
+            prefixed.sort()
+        for _, coin_id in prefixed:
+            if len(found) >= limit:
+                return list(found.values())[:limit]
+            found.setdefault(coin_id, self.by_id[coin_id])
+
+        # Only fall back to fuzzy matching when exact and prefix hits run short
+        grams = _trigrams(query)
+        hits = Counter()
+        for gram in grams:
+            hits.update(self.trigrams.get(gram, ()))
+        fuzzy = [
+            (-count, _rank(self.by_id[coin_id]), coin_id)
+            for coin_id, count in hits.items()
+            if count / len(grams) >= FUZZY_MIN_SIMILARITY and coin_id not in found
+        ]
+        for _, _, coin_id in sorted(fuzzy):
+            if len(found) >= limit:
+                break
+            found[coin_id] = self.by_id[coin_id]
+        return list(found.values())[:limit]
@@ -0,0 +1,163 @@
+import math
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Set
+
+logger = logging.getLogger(__name__)
+
+# quotes/latest costs one credit per 100 coins, rounded up, per call
+COINS_PER_CREDIT = 100
+CMC_MAX_BATCH_SIZE = 1000
+DAYS_PER_MONTH = 30
+RATE_LIMIT_BACKOFF = 60  # seconds to stop calling CMC after a 429
+
+class CMCRateLimitError(Exception):
+    """CoinMarketCap answered 429: the minute rate limit or a daily/monthly credit cap was hit"""
+
+    def __init__(self, error_code, message: str):
+        super().__init__(f"CMC rate limit ({error_code}): {message}")
+        self.error_code = error_code
+
+class CreditBudget:
+    """Rolling account of CoinMarketCap credits and calls against the plan's limits.
+
+    Every response reports what it cost in status.credit_count. Calls and credits are kept
+    per timestamp so the last minute and the last day are summed exactly. Pacing compares the
+    unthrottled demand with the plan: the credits each admitted coin poll cost, times every
+    coin poll that came due, whether it was admitted or not.
+    """
+
+    def __init__(self, monthly_credits: int, calls_per_minute: int, clock=time.time):
+        self.monthly_credits = monthly_credits
+        self.calls_per_minute = calls_per_minute
+        self.clock = clock
+        self.started = clock()
+
+        self._lock = threading.Lock()
+        self._minute = deque()  # call timestamps
+        self._day = deque()  # (timestamp, credits)
+        self._day_credits = 0
+        self._polls = deque()  # (timestamp, coins due, coins admitted) per throttled tick
+        self._due_coins = 0
+        self._admitted_coins = 0
+        self.blocked_until = 0.0
+        self._tier_allowance = {}
+
+        self.stats = {"calls": 0, "credits": 0, "rate_limited": 0, "paced_ticks": 0}
+
+    def _expire(self, now: float):
+        while self._minute and self._minute[0] <= now - 60:
+            self._minute.popleft()
+        while self._day and self._day[0][0] <= now - 86400:
+            self._day_credits -= self._day.popleft()[1]
+        while self._polls and self._polls[0][0] <= now - 86400:
+            _, due, admitted = self._polls.popleft()
+            self._due_coins -= due
+            self._admitted_coins -= admitted
+
+    def record(self, credits: int):
+        """Account for one completed call"""
+        now = self.clock()
+        with self._lock:
+            self._minute.append(now)
+            self._day.append((now, credits))
+            self._day_credits += credits
+            self.stats["calls"] += 1
+            self.stats["credits"] += credits
+            self._expire(now)
+
+    def rate_limited(self, error: CMCRateLimitError):
+        """Stop calling CMC for a while after it refused a call"""
+        with self._lock:
+            self.blocked_until = self.clock() + RATE_LIMIT_BACKOFF
+            self.stats["rate_limited"] += 1
+        logger.warning(f"⚠️🟡 CMC RATE LIMIT 🟡⚠️ {error}, pausing calls for {RATE_LIMIT_BACKOFF}s")
+
+    def blocked(self) -> bool:
+        return self.clock() < self.blocked_until
+
+    def minute_calls(self) -> int:
+        with self._lock:
+            self._expire(self.clock())
+            return len(self._minute)
+
+    def day_credits(self) -> int:
+        with self._lock:
+            self._expire(self.clock())
+            return self._day_credits
+
+    def _per_month(self, day_amount: float) -> float:
+        """Extrapolate the last day's amount to a month, from a shorter run after startup"""
+        observed = min(86400.0, max(60.0, self.clock() - self.started))
+        return day_amount * (86400.0 / observed) * DAYS_PER_MONTH
+
+    def projected_monthly_credits(self) -> float:
+        """Monthly spend if the last day's rate holds"""
+        return self._per_month(self.day_credits())
+
+    def demanded_monthly_credits(self) -> float:
+        """Monthly spend if every due coin poll were admitted, at what admitted polls have cost"""
+        with self._lock:
+            self._expire(self.clock())
+            if not self._admitted_coins:
+                return 0.0
+            credits_per_coin = self._day_credits / self._admitted_coins
+            due_coins = self._due_coins
+        return self._per_month(due_coins * credits_per_coin)
+
+    def pace(self) -> float:
+        """How many times over the monthly budget unthrottled polling would run, never below 1"""
+        if self.monthly_credits <= 0:
+            return 1.0
+        return max(1.0, self.demanded_monthly_credits() / self.monthly_credits)
+
+    def batch_size(self, coin_count: int) -> int:
+        """Coins per call: 100 is the cheapest per credit, larger batches only when calls run short"""
+        calls_left = max(1, self.calls_per_minute - self.minute_calls())
+        batches = math.ceil(coin_count / COINS_PER_CREDIT)
+        if batches <= calls_left:
+            return COINS_PER_CREDIT
+        size = math.ceil(coin_count / calls_left / COINS_PER_CREDIT) * COINS_PER_CREDIT
+        return min(size, CMC_MAX_BATCH_SIZE)
+
+    def throttle(self, due_coins: Dict[str, int]) -> Set[str]:
+        """Admit due tiers, given as tier -> coins due, so each gets 1/pace of its polls.
+
+        Each tier earns 1/pace of a poll every time it comes due and is admitted once it has a
+        whole one, so a pace of 1.5 keeps two polls in three rather than rounding to one in two.
+        """
+        if self.monthly_credits <= 0:
+            return set(due_coins)
+        pace = self.pace()
+        admitted = set()
+        for tier in due_coins:
+            allowance = self._tier_allowance.get(tier, 1.0) if pace > 1 else 1.0
+            if allowance >= 1.0:
+                admitted.add(tier)
+                allowance -= 1.0
+            self._tier_allowance[tier] = allowance + 1.0 / pace
+        if admitted != set(due_coins):
+            self.stats["paced_ticks"] += 1
+
+        with self._lock:
+            now = self.clock()
+            due = sum(due_coins.values())
+            taken = sum(due_coins[tier] for tier in admitted)
+            self._polls.append((now, due, taken))
+            self._due_coins += due
+            self._admitted_coins += taken
+            self._expire(now)
+        return admitted
+
+    def report(self) -> Dict:
+        return {
+            "minute_calls": self.minute_calls(),
+            "calls_per_minute": self.calls_per_minute,
+            "day_credits": self.day_credits(),
+            "projected_monthly_credits": round(self.projected_monthly_credits()),
+            "demanded_monthly_credits": round(self.demanded_monthly_credits()),
+            "monthly_credits": self.monthly_credits,
+            **self.stats
+        }
@@ -0,0 +1,78 @@
+import time
+from typing import Callable, Dict, List
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+def build_digests(notifications: List[Dict], format_line: Callable[[Dict], str],
+                  limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[Dict]:
+    """Pack notifications into as few digest messages as fit the limit, biggest moves first"""
+    ordered = sorted(notifications, key=lambda n: abs(n["price_change"]), reverse=True)
+    # Room for the header, which only gets its final counts once the chunks are known
+    budget = limit - 64
+
+    chunks, lines, size = [], [], 0
+    for notif in ordered:
+        line = format_line(notif)[:budget]
+        if lines and size + len(line) + 1 > budget:
+            chunks.append(lines)
+            lines, size = [], 0
+        lines.append((notif, line))
+        size += len(line) + 1
+    if lines:
+        chunks.append(lines)
+
+    digests = []
+    for part, chunk in enumerate(chunks, 1):
+        header = f"Market move: {len(ordered)} alerts"
+        if len(chunks) > 1:
+            header += f" ({part}/{len(chunks)})"
+        digests.append({
+            "type": "digest",
+            "notifications": [notif for notif, _ in chunk],
+            "text": "\n".join([header] + [line for _, line in chunk])
+        })
+    return digests
+
+class DigestBuffer:
+    """Collects notifications of the coalesced types until the window closes.
+
+    With a window of 0 everything collected in a cycle goes out at the end of that cycle.
+    Types that are not coalesced, and a digest that would hold a single notification,
+    are passed through unchanged.
+    """
+
+    def __init__(self, types, window: float, format_line: Callable[[Dict], str], clock=time.monotonic):
+        self.types = set(types)
+        self.window = window
+        self.format_line = format_line
+        self.clock = clock
+        self.pending = []
+        self.opened = None
+        self.stats = {"notifications": 0, "messages": 0}
+
+    def add(self, notifications: List[Dict]) -> List[Dict]:
+        """Buffer coalesced notifications and return the ones to send right away"""
+        immediate = []
+        for notif in notifications:
+            if notif["type"] in self.types:
+                if not self.pending:
+                    self.opened = self.clock()
+                self.pending.append(notif)
+            else:
+                immediate.append(notif)
+        self.stats["notifications"] += len(immediate)
+        self.stats["messages"] += len(immediate)
+        return immediate
+
+    def ready(self) -> bool:
+        return bool(self.pending) and self.clock() - self.opened >= self.window
+
+    def take(self) -> List[Dict]:
+        """Empty the buffer into digest messages"""
+        pending, self.pending = self.pending, []
+        if not pending:
+            return []
+        messages = pending if len(pending) == 1 else build_digests(pending, self.format_line)
+        self.stats["notifications"] += len(pending)
+        self.stats["messages"] += len(messages)
+        return messages
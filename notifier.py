@@ -0,0 +1,402 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_QUEUE_SIZE = 1000
+NOTIFICATION_OVERFLOW_SIZE = 10000  # past this many overflowed, notifications wait in the outbox only
+NOTIFICATION_WORKERS = 4
+DRAIN_TIMEOUT = 30  # seconds allowed to deliver what is left at shutdown
+MAX_SEND_ATTEMPTS = 5  # failed deliveries are re-queued until this many attempts
+RETRY_BACKOFF = 2  # seconds before the first retry of a failed delivery, doubling with each attempt
+RETRY_BACKOFF_MAX = 60
+
+# Telegram allows about 30 messages per second overall and one per second in a chat
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_GLOBAL_BURST = 30
+TELEGRAM_CHAT_RATE = 1
+TELEGRAM_CHAT_BURST = 3
+
+class TelegramRetryAfter(Exception):
+    """Telegram answered 429 and asked to wait retry_after seconds before sending again"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Flood control exceeded, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of refusing.
+
+    Tokens may go negative: each reservation returns how long the caller has to wait for
+    its token, so concurrent senders queue up behind each other at exactly the bucket rate.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take one token and return the seconds to wait before using it"""
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """Hand out no token for the next seconds"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+class TelegramRateLimiter:
+    """Global and per-chat token buckets matching Telegram's send limits"""
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE, clock=time.monotonic):
+        self.chat_rate = chat_rate
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate, TELEGRAM_GLOBAL_BURST, clock)
+        self.chat_buckets = {}
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        with self._lock:
+            if chat_id not in self.chat_buckets:
+                self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, TELEGRAM_CHAT_BURST, self.clock)
+            return self.chat_buckets[chat_id]
+
+    def reserve(self, chat_id) -> float:
+        """Seconds to wait before the next message to chat_id may go out"""
+        return max(self._chat_bucket(chat_id).reserve(), self.global_bucket.reserve())
+
+    def retry_after(self, chat_id, seconds: float):
+        """Honour a 429 by holding every sender back for the requested time"""
+        self._chat_bucket(chat_id).pause(seconds)
+        self.global_bucket.pause(seconds)
+
+def _new_stats() -> Dict:
+    return {
+        "enqueued": 0,
+        "sent": 0,
+        "failed": 0,
+        "dropped": 0,
+        "overflowed": 0,  # submits that found the queue full and waited in the overflow
+        "outboxed": 0,  # submits that found the overflow full too and were left in the outbox
+        "max_depth": 0,
+        "retried": 0,
+        "rate_limited": 0,
+        "throttled_seconds": 0.0,  # time senders waited for a rate limit token
+        "total_queue_seconds": 0.0  # enqueue-to-delivery time of sent notifications
+    }
+
+def _outbox_ids(notification) -> Set:
+    """Outbox ids of a notification, or of every notification inside a digest"""
+    return {item.get("outbox_id") for item in notification.get("notifications") or [notification]} - {None}
+
+def _next_attempt(stats: Dict, enqueued_at: float, attempt: int, notification, backoff: bool = True):
+    """The queue item for retrying a failed delivery, or None once attempts run out"""
+    if attempt >= MAX_SEND_ATTEMPTS:
+        stats["failed"] += 1
+        logger.error(f"❌🔴⚠️ TELEGRAM ERROR ⚠️🔴❌ Giving up on a notification after {attempt} attempts")
+        return None
+    stats["retried"] += 1
+    # A 429 is paced by the rate limiter; other failures wait longer after every attempt
+    not_before = time.monotonic() + min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** (attempt - 1)) if backoff else 0.0
+    return enqueued_at, attempt + 1, notification, not_before
+
+class NotificationQueue:
+    """Bounded queue of notifications drained by sender tasks on the event loop.
+
+    Evaluation only enqueues and never waits: once the queue is full, notifications line up
+    in an overflow that workers move into the queue as they finish. The overflow is bounded
+    too; beyond it a notification is not held in memory but left in the outbox, which has
+    every notification, to be submitted again later. Workers take a rate limit token before
+    every send and re-queue deliveries that failed, after a growing backoff, or hit a 429.
+    Once attempts run out on_failed is told, and the notification stays in the outbox.
+    """
+
+    def __init__(self, send: Callable, workers: int = NOTIFICATION_WORKERS, maxsize: int = NOTIFICATION_QUEUE_SIZE,
+                 chat_id=None, limiter: Optional[TelegramRateLimiter] = None, overflow_size: int = NOTIFICATION_OVERFLOW_SIZE,
+                 on_failed: Optional[Callable] = None):
+        self.send = send
+        self.on_failed = on_failed
+        self.chat_id = chat_id
+        self.limiter = limiter or TelegramRateLimiter()
+        self.worker_count = workers
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflow = deque()
+        self.overflow_size = overflow_size
+        # Outbox ids queued, overflowed or being delivered, so a re-submit skips them
+        self.in_flight = set()
+        self.workers = []
+        self.closed = False
+        self.stats = _new_stats()
+
+    def start(self):
+        self.workers = [asyncio.create_task(self._worker(), name=f"notifier-{i}") for i in range(self.worker_count)]
+
+    def depth(self) -> int:
+        return self.queue.qsize() + len(self.overflow)
+
+    def submit(self, notification) -> bool:
+        """Enqueue a notification without waiting, behind the overflow when the queue is full"""
+        if self.closed:
+            self.stats["dropped"] += 1
+            return False
+        item = (time.monotonic(), 1, notification, 0.0)
+        if self.overflow or self.queue.full():
+            if len(self.overflow) >= self.overflow_size:
+                self.stats["outboxed"] += 1
+                return False
+            self.stats["overflowed"] += 1
+            self.overflow.append(item)
+        else:
+            self.queue.put_nowait(item)
+        self.in_flight |= _outbox_ids(notification)
+        self.stats["enqueued"] += 1
+        self.stats["max_depth"] = max(self.stats["max_depth"], self.depth())
+        return True
+
+    def submit_pending(self, notifications: Iterable[Dict]) -> int:
+        """Submit outbox notifications again unless they are already on their way, returning how many"""
+        return sum(1 for notif in notifications if not _outbox_ids(notif) & self.in_flight and self.submit(notif))
+
+    def _refill(self):
+        """Move overflowed notifications into the queue while it has room"""
+        while self.overflow and not self.queue.full():
+            self.queue.put_nowait(self.overflow.popleft())
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                # A retry that found the queue full stays with this worker
+                while item is not None:
+                    item = await self._deliver(*item)
+            finally:
+                # Refill before task_done so join() cannot finish with notifications still overflowed
+                self._refill()
+                self.queue.task_done()
+
+    async def _deliver(self, enqueued_at: float, attempt: int, notification, not_before: float):
+        """Send one notification and return it for another attempt if it could not be re-queued"""
+        rate_limited = False
+        try:
+            backoff = not_before - time.monotonic()
+            if backoff > 0:
+                await asyncio.sleep(backoff)
+            delay = self.limiter.reserve(self.chat_id)
+            if delay:
+                self.stats["throttled_seconds"] += delay
+                await asyncio.sleep(delay)
+            if await self.send(notification):
+                self.stats["sent"] += 1
+                self.stats["total_queue_seconds"] += time.monotonic() - enqueued_at
+                self.in_flight -= _outbox_ids(notification)
+                return None
+        except TelegramRetryAfter as e:
+            self.stats["rate_limited"] += 1
+            logger.warning(f"⚠️🟡 TELEGRAM RATE LIMIT 🟡⚠️ {e}")
+            self.limiter.retry_after(self.chat_id, e.retry_after)
+            # Waiting out a 429 does not count against the delivery attempts
+            attempt -= 1
+            rate_limited = True
+        except Exception as e:
+            logger.error(f"❌🔴⚠️ TELEGRAM ERROR ⚠️🔴❌ Notification worker failed: {e}")
+
+        retry = _next_attempt(self.stats, enqueued_at, attempt, notification, backoff=not rate_limited)
+        if retry is None:
+            self.in_flight -= _outbox_ids(notification)
+            if self.on_failed:
+                self.on_failed(notification)
+            return None
+        try:
+            self.queue.put_nowait(retry)
+            return None
+        except asyncio.QueueFull:
+            return retry
+
+    async def close(self, timeout: float = DRAIN_TIMEOUT):
+        """Stop accepting notifications, deliver what is queued, then stop the workers"""
+        self.closed = True
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"❌🔴⚠️ NOTIFICATION QUEUE ⚠️🔴❌ {self.depth()} notifications undelivered after {timeout}s drain")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        logger.info(f"Notification queue closed: {self.stats}")
+
+class ThreadedNotificationQueue:
+    """NotificationQueue for the blocking standalone loop, drained by sender threads"""
+
+    def __init__(self, send: Callable, workers: int = NOTIFICATION_WORKERS, maxsize: int = NOTIFICATION_QUEUE_SIZE,
+                 chat_id=None, limiter: Optional[TelegramRateLimiter] = None, overflow_size: int = NOTIFICATION_OVERFLOW_SIZE,
+                 on_failed: Optional[Callable] = None):
+        self.send = send
+        self.on_failed = on_failed
+        self.chat_id = chat_id
+        self.limiter = limiter or TelegramRateLimiter()
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflow = deque()
+        self.overflow_size = overflow_size
+        self.in_flight = set()
+        # Keeps the overflow in order with the queue between submitters and refilling workers
+        self._overflow_lock = threading.Lock()
+        self.closed = False
+        self.stats = _new_stats()
+        self._stats_lock = threading.Lock()
+        self.workers = [
+            threading.Thread(target=self._worker, name=f"notifier-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def _count(self, key: str, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def depth(self) -> int:
+        return self.queue.qsize() + len(self.overflow)
+
+    def _put(self, item, bounded: bool = False) -> str:
+        """Queue an item without waiting: "queued", "overflowed", or "outboxed" when bounded and the overflow is full"""
+        with self._overflow_lock:
+            if not self.overflow:
+                try:
+                    self.queue.put_nowait(item)
+                    return "queued"
+                except queue.Full:
+                    pass
+            if bounded and len(self.overflow) >= self.overflow_size:
+                return "outboxed"
+            self.overflow.append(item)
+            return "overflowed"
+
+    def submit(self, notification) -> bool:
+        """Enqueue a notification without waiting, behind the overflow when the queue is full"""
+        if self.closed:
+            self._count("dropped")
+            return False
+        ids = _outbox_ids(notification)
+        with self._stats_lock:
+            # Claimed before the put so a worker finishing it quickly cannot release them first
+            self.in_flight |= ids
+        placed = self._put((time.monotonic(), 1, notification, 0.0), bounded=True)
+        if placed != "queued":
+            self._count(placed)
+        if placed == "outboxed":
+            with self._stats_lock:
+                self.in_flight -= ids
+            return False
+        self._count("enqueued")
+        with self._stats_lock:
+            self.stats["max_depth"] = max(self.stats["max_depth"], self.depth())
+        return True
+
+    def submit_pending(self, notifications: Iterable[Dict]) -> int:
+        """Submit outbox notifications again unless they are already on their way, returning how many"""
+        submitted = 0
+        for notif in notifications:
+            with self._stats_lock:
+                on_the_way = bool(_outbox_ids(notif) & self.in_flight)
+            if not on_the_way and self.submit(notif):
+                submitted += 1
+        return submitted
+
+    def _refill(self):
+        with self._overflow_lock:
+            while self.overflow:
+                try:
+                    self.queue.put_nowait(self.overflow[0])
+                except queue.Full:
+                    return
+                self.overflow.popleft()
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                while item is not None:
+                    item = self._deliver(*item)
+            finally:
+                self._refill()
+                self.queue.task_done()
+
+    def _release(self, notification):
+        with self._stats_lock:
+            self.in_flight -= _outbox_ids(notification)
+
+    def _deliver(self, enqueued_at: float, attempt: int, notification, not_before: float):
+        rate_limited = False
+        try:
+            backoff = not_before - time.monotonic()
+            if backoff > 0:
+                time.sleep(backoff)
+            delay = self.limiter.reserve(self.chat_id)
+            if delay:
+                self._count("throttled_seconds", delay)
+                time.sleep(delay)
+            if self.send(notification):
+                self._count("sent")
+                self._count("total_queue_seconds", time.monotonic() - enqueued_at)
+                self._release(notification)
+                return None
+        except TelegramRetryAfter as e:
+            self._count("rate_limited")
+            logger.warning(f"⚠️🟡 TELEGRAM RATE LIMIT 🟡⚠️ {e}")
+            self.limiter.retry_after(self.chat_id, e.retry_after)
+            attempt -= 1
+            rate_limited = True
+        except Exception as e:
+            logger.error(f"❌🔴⚠️ TELEGRAM ERROR ⚠️🔴❌ Notification worker failed: {e}")
+
+        with self._stats_lock:
+            retry = _next_attempt(self.stats, enqueued_at, attempt, notification, backoff=not rate_limited)
+        if retry is None:
+            self._release(notification)
+            if self.on_failed:
+                self.on_failed(notification)
+            return None
+        if self.closed:
+            # Once closing, shutdown sentinels may already be queued, so retry here instead
+            return retry
+        try:
+            self.queue.put_nowait(retry)
+            return None
+        except queue.Full:
+            return retry
+
+    def close(self, timeout: float = DRAIN_TIMEOUT):
+        """Stop accepting notifications and give the workers up to timeout to deliver the rest"""
+        self.closed = True
+        deadline = time.monotonic() + timeout
+        for _ in self.workers:
+            # Sentinels queue behind the remaining and overflowed notifications, so the workers
+            # drain first, and never wait for room
+            self._put(None)
+        for worker in self.workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        undelivered = sum(1 for item in list(self.queue.queue) + list(self.overflow) if item is not None)
+        if undelivered:
+            logger.error(f"❌🔴⚠️ NOTIFICATION QUEUE ⚠️🔴❌ {undelivered} notifications undelivered after {timeout}s drain")
+        logger.info(f"Notification queue closed: {self.stats}")
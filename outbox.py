@@ -0,0 +1,156 @@
+import os
+import json
+import logging
+import threading
+from datetime import timedelta
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_FILE = "outbox.log"
+OUTBOX_COMPACT_RECORDS = 1000
+OUTBOX_MAX_FAILED_RUNS = 3  # times the notifier may give up on a notification before it is dropped
+
+def _encode(notif: Dict) -> Dict:
+    record = dict(notif)
+    if isinstance(record.get("time_elapsed"), timedelta):
+        record["time_elapsed"] = record["time_elapsed"].total_seconds()
+    return record
+
+def _decode(record: Dict) -> Dict:
+    notif = dict(record)
+    if notif.get("time_elapsed") is not None:
+        notif["time_elapsed"] = timedelta(seconds=notif["time_elapsed"])
+    return notif
+
+class Outbox:
+    """Append-only log of notifications that have not been delivered yet.
+
+    Each notification is appended as an "add" record with a sequence id and later
+    acknowledged with a "sent" record. Every time the notifier gives up on one a "failed"
+    record is added, and after OUTBOX_MAX_FAILED_RUNS of them a terminal "dead" record takes
+    it out of the log, so an alert Telegram always rejects is neither replayed on every start
+    nor keeps the log from being compacted. Appends only reach the OS buffer; sync() makes
+    everything written so far durable with one fsync, and the monitor calls it before
+    every anchor write so an anchor on disk always has its alert on disk too. On startup
+    the log is replayed and rewritten with just the unsent notifications.
+    """
+
+    def __init__(self, path: str = OUTBOX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._unsent = {}
+        self._failures = {}
+        self._next_id = 1
+        self._records = 0
+        self._dirty = False
+        self._replay()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-append
+                    logger.warning(f"Skipping unreadable outbox record in {self.path}")
+                    continue
+                if record["op"] == "add":
+                    self._unsent[record["id"]] = _decode(record["n"])
+                    if record.get("failures"):
+                        self._failures[record["id"]] = record["failures"]
+                elif record["op"] == "failed":
+                    self._failures[record["id"]] = self._failures.get(record["id"], 0) + 1
+                elif record["op"] in ("sent", "dead"):
+                    self._unsent.pop(record["id"], None)
+                    self._failures.pop(record["id"], None)
+                self._next_id = max(self._next_id, record["id"] + 1)
+        if self._unsent:
+            logger.info(f"Outbox has {len(self._unsent)} unsent notifications from the last run")
+        self._rewrite()
+
+    def _rewrite(self):
+        """Replace the log with add records for the unsent notifications only"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for outbox_id, notif in self._unsent.items():
+                record = {"op": "add", "id": outbox_id, "n": _encode(notif)}
+                if self._failures.get(outbox_id):
+                    record["failures"] = self._failures[outbox_id]
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._records = len(self._unsent)
+
+    def _write(self, record: Dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._records += 1
+        self._dirty = True
+
+    def add(self, notifications: List[Dict]):
+        """Record new notifications, tagging each with its outbox_id"""
+        with self._lock:
+            for notif in notifications:
+                notif["outbox_id"] = self._next_id
+                self._next_id += 1
+                self._unsent[notif["outbox_id"]] = notif
+                self._write({"op": "add", "id": notif["outbox_id"], "n": _encode(notif)})
+
+    def mark_sent(self, notif: Dict):
+        """Acknowledge a delivered notification, or every notification inside a digest"""
+        with self._lock:
+            for item in notif.get("notifications") or [notif]:
+                outbox_id = item.get("outbox_id")
+                if self._unsent.pop(outbox_id, None) is not None:
+                    self._failures.pop(outbox_id, None)
+                    self._write({"op": "sent", "id": outbox_id})
+
+    def mark_failed(self, notif: Dict) -> int:
+        """Count a notification the notifier gave up on, dropping it for good after too many.
+
+        Returns how many were dropped, counting each notification inside a digest.
+        """
+        dead = 0
+        with self._lock:
+            for item in notif.get("notifications") or [notif]:
+                outbox_id = item.get("outbox_id")
+                if outbox_id not in self._unsent:
+                    continue
+                failures = self._failures.get(outbox_id, 0) + 1
+                if failures < OUTBOX_MAX_FAILED_RUNS:
+                    self._failures[outbox_id] = failures
+                    self._write({"op": "failed", "id": outbox_id})
+                else:
+                    del self._unsent[outbox_id]
+                    self._failures.pop(outbox_id, None)
+                    self._write({"op": "dead", "id": outbox_id})
+                    dead += 1
+        return dead
+
+    def pending(self) -> List[Dict]:
+        """Notifications not yet acknowledged, oldest first"""
+        with self._lock:
+            return list(self._unsent.values())
+
+    def sync(self):
+        """Make every record written so far durable, compacting the log once nothing is pending"""
+        with self._lock:
+            if not self._dirty:
+                return
+            if not self._unsent and self._records >= OUTBOX_COMPACT_RECORDS:
+                self._file.close()
+                self._rewrite()
+                self._file = open(self.path, "a", encoding="utf-8")
+            else:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            self._file.close()
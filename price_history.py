@@ -0,0 +1,179 @@
+import os
+import struct
+import logging
+from array import array
+from collections import deque
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class PriceHistory:
+    """Fixed-capacity ring buffer of (timestamp, price) samples for one coin.
+
+    Timestamps are epoch seconds and must be appended in increasing order, so a window
+    is located by bisecting the ring rather than scanning it.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # Preallocated once, appends only overwrite slots
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.prices = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp: float, price: float):
+        if self.count < self.capacity:
+            slot = (self.start + self.count) % self.capacity
+            self.count += 1
+        else:
+            # Full: overwrite the oldest sample
+            slot = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.timestamps[slot] = timestamp
+        self.prices[slot] = price
+
+    def _slot(self, index: int) -> int:
+        return (self.start + index) % self.capacity
+
+    def latest(self):
+        """Most recent (timestamp, price), or None when empty"""
+        if not self.count:
+            return None
+        slot = self._slot(self.count - 1)
+        return self.timestamps[slot], self.prices[slot]
+
+    def index_since(self, since: float) -> int:
+        """Logical index of the first sample at or after since, found by bisection"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[self._slot(mid)] < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def window(self, since: float) -> List[Tuple[float, float]]:
+        """Samples at or after since, oldest first"""
+        return [
+            (self.timestamps[self._slot(i)], self.prices[self._slot(i)])
+            for i in range(self.index_since(since), self.count)
+        ]
+
+    def price_at(self, timestamp: float):
+        """Price of the last sample at or before timestamp, or None if the history starts later"""
+        index = self.index_since(timestamp)
+        if index < self.count and self.timestamps[self._slot(index)] == timestamp:
+            return self.prices[self._slot(index)]
+        if index == 0:
+            return None
+        return self.prices[self._slot(index - 1)]
+
+    def max_move(self, since: float) -> float:
+        """Largest percent move between the lowest and highest price since the given time"""
+        prices = [price for _, price in self.window(since)]
+        if len(prices) < 2 or min(prices) <= 0:
+            return 0.0
+        return (max(prices) - min(prices)) / min(prices) * 100
+
+    def samples(self) -> List[Tuple[float, float]]:
+        return self.window(float('-inf'))
+
+class WindowExtrema:
+    """Sliding-window minimum and maximum over a sample stream using monotonic deques.
+
+    The min deque keeps increasing prices and the max deque decreasing ones, so each sample
+    is pushed and evicted at most once and both extremes are read from the front in O(1).
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._min = deque()
+        self._max = deque()
+
+    def push(self, timestamp: float, price: float):
+        while self._min and self._min[-1][1] >= price:
+            self._min.pop()
+        self._min.append((timestamp, price))
+        while self._max and self._max[-1][1] <= price:
+            self._max.pop()
+        self._max.append((timestamp, price))
+
+        # Samples exactly window_seconds old still count as inside the window
+        oldest = timestamp - self.window_seconds
+        while self._min[0][0] < oldest:
+            self._min.popleft()
+        while self._max[0][0] < oldest:
+            self._max.popleft()
+
+    def minimum(self):
+        """(timestamp, price) of the lowest sample in the window, or None when empty"""
+        return self._min[0] if self._min else None
+
+    def maximum(self):
+        """(timestamp, price) of the highest sample in the window, or None when empty"""
+        return self._max[0] if self._max else None
+
+    def reset(self, timestamp: float, price: float):
+        """Forget the window and restart it from one sample"""
+        self._min.clear()
+        self._max.clear()
+        self.push(timestamp, price)
+
+    def move(self, timestamp: float, price: float):
+        """Largest percent move ending at this sample, as (signed percent, seconds since the extreme)"""
+        low_time, low = self._min[0]
+        high_time, high = self._max[0]
+        up = (price - low) / low * 100 if low > 0 else 0.0
+        down = (price - high) / high * 100 if high > 0 else 0.0
+        if up >= -down:
+            return up, timestamp - low_time
+        return down, timestamp - high_time
+
+HISTORY_HEADER = struct.Struct("<4sHI")
+HISTORY_COIN = struct.Struct("<qI")
+HISTORY_MAGIC = b"PMPH"
+HISTORY_VERSION = 1
+
+def save_histories(path: str, histories: Dict[int, PriceHistory]):
+    """Write every coin's samples to a compact binary file, replacing it atomically"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HISTORY_HEADER.pack(HISTORY_MAGIC, HISTORY_VERSION, len(histories)))
+        for coin_id, history in histories.items():
+            samples = history.samples()
+            f.write(HISTORY_COIN.pack(coin_id, len(samples)))
+            array('d', (t for t, _ in samples)).tofile(f)
+            array('d', (p for _, p in samples)).tofile(f)
+    os.replace(tmp_path, path)
+    logger.info(f"Saved price history for {len(histories)} coins to {path}")
+
+def load_histories(path: str, capacity: int) -> Dict[int, PriceHistory]:
+    """Read histories saved by save_histories, keeping the newest samples that fit capacity"""
+    histories = {}
+    if not os.path.exists(path):
+        return histories
+    try:
+        with open(path, "rb") as f:
+            magic, version, coins = HISTORY_HEADER.unpack(f.read(HISTORY_HEADER.size))
+            if magic != HISTORY_MAGIC or version != HISTORY_VERSION:
+                logger.error(f"{path} is not a version {HISTORY_VERSION} price history file, ignoring it")
+                return histories
+            for _ in range(coins):
+                coin_id, count = HISTORY_COIN.unpack(f.read(HISTORY_COIN.size))
+                timestamps = array('d')
+                timestamps.fromfile(f, count)
+                prices = array('d')
+                prices.fromfile(f, count)
+                history = PriceHistory(capacity)
+                for timestamp, price in zip(timestamps[-capacity:], prices[-capacity:]):
+                    history.append(timestamp, price)
+                histories[coin_id] = history
+        logger.info(f"Loaded price history for {len(histories)} coins from {path}")
+    except Exception as e:
+        logger.error(f"Error loading price history: {e}")
+    return histories
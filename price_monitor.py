@@ -1,13 +1,29 @@
 import os
-import json
+import re
+import math
+import asyncio
 import time
 import logging
+import threading
 import requests
+from collections import Counter
 from datetime import datetime, timedelta
 from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from filelock import FileLock
-import struct
+from cmc_client import CMCClient
+from credit_budget import CreditBudget, CMCRateLimitError
+from storage import create_storage, serialize_watchlist_entry
+import numpy as np
+import rule_engine
+from rule_engine import PriceColumns, CompiledThresholds
+from scheduler import PollScheduler
+from notifier import ThreadedNotificationQueue, TelegramRetryAfter
+from digest import DigestBuffer
+from outbox import Outbox, OUTBOX_MAX_FAILED_RUNS
+from coin_metadata import CoinMetadata
+from telegram.error import RetryAfter
+from price_history import PriceHistory, WindowExtrema, load_histories, save_histories
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -19,10 +35,43 @@ load_dotenv()
 CMC_API_KEY = os.getenv('CMC_API_KEY')
 TG_BOT_TOKEN = os.getenv('TG_BOT_TOKEN')
 TG_CHAT_ID = os.getenv('TG_CHAT_ID')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
 
-CMC_BASE_URL = "https://pro-api.coinmarketcap.com/v1"
 PRICE_CHECK_INTERVAL = 60
-BATCH_SIZE = 100
+
+# Poll interval in seconds per coin tier; coins without a tier use the default one
+POLL_TIERS = {"hot": 15, "default": PRICE_CHECK_INTERVAL, "tail": 300}
+DEFAULT_POLL_TIER = "default"
+# Comma-separated coin ids pinned to the hot and tail tiers
+HOT_COINS = os.getenv('HOT_COINS', '')
+TAIL_COINS = os.getenv('TAIL_COINS', '')
+# Move unpinned coins between tiers by how close they are to a threshold and recent volatility
+DYNAMIC_TIERING = os.getenv('DYNAMIC_TIERING', 'false').lower() == 'true'
+TIERING_VOLATILITY_WINDOW = 900  # seconds of history used to measure volatility
+HOT_PROXIMITY = 0.75  # fraction of the nearest threshold already covered
+HOT_VOLATILITY_PERCENT = 1.0
+TAIL_PROXIMITY = 0.25
+TAIL_VOLATILITY_PERCENT = 0.3
+# CMC plan limits; batch size and poll pacing adapt to stay under them
+CMC_MONTHLY_CREDITS = int(os.getenv('CMC_MONTHLY_CREDITS', '0'))  # 0 turns poll pacing off
+CMC_CALLS_PER_MINUTE = int(os.getenv('CMC_CALLS_PER_MINUTE', '30'))
+FETCH_CONCURRENCY = 4
+MAX_FETCH_RETRIES = 3
+FETCH_RETRY_DELAY = 2
+WATCHLIST_FLUSH_INTERVAL = 30
+PRICE_HISTORY_RETENTION = 3600  # seconds of samples kept per coin
+PRICE_HISTORY_FILE = os.getenv('PRICE_HISTORY_FILE')  # set to persist history across restarts
+WINDOWED_DETECTION = os.getenv('WINDOWED_DETECTION', 'false').lower() == 'true'
+# "full" evaluates every coin each cycle, "incremental" skips coins whose CMC quote has not changed
+EVALUATION_MODE = os.getenv('EVALUATION_MODE', 'full')
+INCREMENTAL_EVALUATION = EVALUATION_MODE == 'incremental'
+# Notification types combined into digest messages (e.g. "short_term,absolute"), and how many
+# seconds to keep collecting them; 0 sends one digest per polling cycle
+DIGEST_TYPES = [t.strip() for t in os.getenv('DIGEST_TYPES', '').split(',') if t.strip()]
+DIGEST_WINDOW = float(os.getenv('DIGEST_WINDOW', '0'))
+OUTBOX_FILE = os.getenv('OUTBOX_FILE', 'outbox.log')
+OUTBOX_RESUBMIT_INTERVAL = 300  # seconds between re-submits of outbox alerts the notifier gave up on
+METADATA_FILE = os.getenv('METADATA_FILE', 'coin_map.json')
 
 SHORT_TERM_THRESHOLDS = [
     {"percent": 0.2, "minutes": 2},
@@ -39,272 +88,547 @@ LONG_TERM_THRESHOLDS = [
     {"percent": 15.0, "minutes": float('inf')}
 ]
 
+ABSOLUTE_CHANGE_PERCENT = 2.0
+
+# Short-term thresholds with a finite window, checked against sliding min/max when WINDOWED_DETECTION is on
+SHORT_TERM_WINDOWS = [t for t in SHORT_TERM_THRESHOLDS if t["minutes"] != float('inf')]
+
+# Threshold tables compiled once into bisectable breakpoints
+SHORT_TERM_RULES = CompiledThresholds(SHORT_TERM_THRESHOLDS)
+LONG_TERM_RULES = CompiledThresholds(LONG_TERM_THRESHOLDS)
+
+def _elapsed_text(notif: Dict) -> str:
+    hours = notif["time_elapsed"].total_seconds() / 3600
+    return (
+        f"{int(hours)} hours" if hours >= 1
+        else f"{int(notif['time_elapsed'].total_seconds() / 60)} minutes"
+    )
+
+def format_notification(notif: Dict) -> str:
+    """Build the Telegram message text for a notification"""
+    if notif["type"] == "digest":
+        return notif["text"]
+
+    direction = "up" if notif["price_change"] > 0 else "down"
+
+    # Different message format based on notification type
+    if notif["type"] == "absolute":
+        # Absolute change notification without time
+        return (
+            f"{notif['coin_name']} ({notif['coin_symbol']}) {direction} by {abs(notif['price_change']):.2f}%\n"
+            f"Current price: ${notif['current_price']:.4f}"
+        )
+
+    # Short-term or long-term notification with time
+    return (
+        f"{notif['coin_name']} ({notif['coin_symbol']}) {direction} by {abs(notif['price_change']):.2f}% in {_elapsed_text(notif)}\n"
+        f"Current price: ${notif['current_price']:.4f}"
+    )
+
+def format_digest_line(notif: Dict) -> str:
+    """One line of a digest message"""
+    text = f"{notif['coin_symbol']} {notif['price_change']:+.2f}%"
+    if notif["type"] != "absolute":
+        text += f" in {_elapsed_text(notif)}"
+    return f"{text} at ${notif['current_price']:.4f}"
+
 class PriceMonitor:
-    def __init__(self):
+    def __init__(self, storage=None):
+        # Guards the watchlist, tokens and pending changes, which bot handlers may touch from worker threads
+        self._lock = threading.RLock()
         self.tokens = {}
+        # Shared keep-alive session used by every CoinMarketCap call
+        self.budget = CreditBudget(CMC_MONTHLY_CREDITS, CMC_CALLS_PER_MINUTE)
+        self.cmc = CMCClient(CMC_API_KEY, budget=self.budget)
+        # Id, symbol and name lookups from the cached CMC map, loaded on first use
+        self.metadata = CoinMetadata(self.cmc, METADATA_FILE)
+        # Pluggable persistence backend (JSON files or SQLite)
+        self.storage = storage or create_storage(STORAGE_BACKEND)
         # Load tokens
         self.load_tokens()
-        
-        # Initialize watchlist.json if it doesn't exist
-        if not os.path.exists('watchlist.json') or os.path.getsize('watchlist.json') == 0:
-            with open('watchlist.json', 'w') as f:
-                json.dump({}, f, indent=2)
-            logger.info("Created empty watchlist.json file")
+
+        # The in-memory watchlist is the source of truth, storage is only written behind it
+        self.watchlist = self.load_watchlist()
+        self._dirty_coins = set()
+        self._dirty_tokens = set()
+        self._pending_notifications = []
+        # Durable log of undelivered alerts, opened by the process that evaluates and sends
+        self.outbox = None
+
+        # Rolling (timestamp, price) samples per coin, sized by retention over the fastest tier's interval
+        self.history_capacity = math.ceil(PRICE_HISTORY_RETENTION / min(POLL_TIERS.values())) + 1
+        self.price_history = {}
+        if PRICE_HISTORY_FILE:
+            self.price_history = load_histories(PRICE_HISTORY_FILE, self.history_capacity)
+        # Monotonic min/max deques per coin, one per short-term window
+        self.window_extrema = {}
+
+        # Poll tier per coin: pinned from HOT_COINS and TAIL_COINS, otherwise assigned by activity
+        self.pinned_tiers = {}
+        for tier, ids in (("hot", HOT_COINS), ("tail", TAIL_COINS)):
+            for coin_id in filter(None, (i.strip() for i in ids.split(','))):
+                self.pinned_tiers[int(coin_id)] = tier
+        self.coin_tiers = {}
+
+        # Quote timestamps from CMC and the last (last_updated, price) each coin was evaluated at
+        self.quote_updated = {}
+        self._evaluated_quotes = {}
+        # CMC's 24h percent change per coin from the latest quotes, shown by /list
+        self.change_24h = {}
+
+        # Bumped on every add or remove so cached watchlist views know when to rebuild
+        self.watchlist_version = 0
+        self._list_cache = (None, [])
+        self.evaluation_stats = {"cycles": 0, "evaluated": 0, "skipped": 0, "last_evaluated": 0, "last_skipped": 0}
 
     def load_tokens(self):
         try:
-            if os.path.exists('tokens.json'):
-                with open('tokens.json', 'r') as f:
-                    self.tokens = {int(k): v for k, v in json.load(f).items()}
-                    logger.info(f"Loaded {len(self.tokens)} tokens from tokens.json")
-            else:
-                logger.info("No tokens.json found, starting with empty token list")
-                self.save_tokens()
+            self.tokens = self.storage.load_tokens()
         except Exception as e:
             logger.error(f"Error loading tokens: {e}")
             self.tokens = {}
 
-    def save_tokens(self):
-        try:
-            data = {str(k): v for k, v in self.tokens.items()}
-            with open('tokens.json', 'w') as f:
-                json.dump(data, f, indent=2)
-            logger.info(f"Saved {len(self.tokens)} tokens to tokens.json")
-        except Exception as e:
-            logger.error(f"Error saving tokens: {e}")
-
     def add_coin(self, coin_id: int) -> bool:
-        try:
-            # Check if coin already exists in the watchlist file directly
-            watchlist_data = {}
-            if os.path.exists("watchlist.json") and os.path.getsize("watchlist.json") > 0:
-                with open("watchlist.json", "r") as f:
-                    watchlist_data = json.load(f)
-                    
-                    # Check if coin already exists
-                    if str(coin_id) in watchlist_data:
-                        logger.info(f"Coin ID {coin_id} already exists in watchlist")
-                        return True
-            
-            # Get coin info from API
-            headers = {
-                'X-CMC_PRO_API_KEY': CMC_API_KEY,
-                'Accept': 'application/json'
-            }
-            response = requests.get(
-                f"{CMC_BASE_URL}/cryptocurrency/info",
-                headers=headers,
-                params={'id': str(coin_id)}
-            )
-            data = response.json()
-            
-            # Check if the API returned an error
+        result = self.add_coins([coin_id])
+        return coin_id in result["added"] or coin_id in result["existing"]
+
+    def add_coins(self, coin_ids: List[int]) -> Dict[str, List[int]]:
+        """Add many coins with one CMC info call. Returns the added, existing and unknown ids"""
+        result = {"added": [], "existing": [], "missing": []}
+        with self._lock:
+            new_ids = []
+            for coin_id in dict.fromkeys(coin_ids):
+                if coin_id in self.watchlist:
+                    logger.info(f"Coin ID {coin_id} already exists in watchlist")
+                    result["existing"].append(coin_id)
+                else:
+                    new_ids.append(coin_id)
+        if not new_ids:
+            return result
+
+        # Names and symbols come from the local map; only coins it does not know cost an info call
+        coin_data = {}
+        for coin_id in new_ids:
+            cached = self.metadata.get(coin_id)
+            if cached:
+                coin_data[coin_id] = cached
+        unknown = [coin_id for coin_id in new_ids if coin_id not in coin_data]
+        if unknown:
+            try:
+                fetched = self._fetch_coin_info(unknown)
+            except Exception as e:
+                logger.error(f"Error adding coins {unknown}: {e}")
+                fetched = {}
+            for coin_id, info in fetched.items():
+                self.metadata.remember(coin_id, info["name"], info["symbol"])
+            coin_data.update(fetched)
+
+        with self._lock:
+            current_time = datetime.now()
+            for coin_id in new_ids:
+                info = coin_data.get(coin_id)
+                if info is None:
+                    logger.error(f"Coin ID {coin_id} not found in API response")
+                    result["missing"].append(coin_id)
+                    continue
+                # Another /add may have won while the info call was in flight
+                if coin_id in self.watchlist:
+                    result["existing"].append(coin_id)
+                    continue
+
+                # Add to tokens list
+                self.tokens[coin_id] = {
+                    "name": info["name"],
+                    "symbol": info["symbol"]
+                }
+                self._dirty_tokens.add(coin_id)
+
+                # Add to watchlist with current time
+                self.watchlist[coin_id] = {
+                    "short_term": {
+                        "last_price": None,
+                        "last_notification_time": current_time
+                    },
+                    "long_term": {
+                        "last_price": None,
+                        "last_notification_time": current_time
+                    },
+                    "name": info["name"],
+                    "symbol": info["symbol"]
+                }
+                self._dirty_coins.add(coin_id)
+                result["added"].append(coin_id)
+            if result["added"]:
+                self.watchlist_version += 1
+
+        if result["added"]:
+            logger.info(f"Added {len(result['added'])} coins to tokens list and watchlist: {result['added']}")
+        return result
+
+    def _fetch_coin_info(self, coin_ids: List[int]) -> Dict[int, Dict]:
+        """Resolve coin ids to CMC info in one call, dropping ids CMC rejects and asking once more"""
+        data = self.cmc.get("/cryptocurrency/info", params={'id': ','.join(map(str, coin_ids))})
+
+        # One unknown id fails the whole request, and the error message names it
+        if 'status' in data and data['status']['error_code'] != 0:
+            message = data['status']['error_message'] or ""
+            logger.error(f"API Error: {message}")
+            rejected = {int(match) for match in re.findall(r'\d+', message)} & set(coin_ids)
+            remaining = [coin_id for coin_id in coin_ids if coin_id not in rejected]
+            if not rejected or not remaining:
+                return {}
+            data = self.cmc.get("/cryptocurrency/info", params={'id': ','.join(map(str, remaining))})
             if 'status' in data and data['status']['error_code'] != 0:
                 logger.error(f"API Error: {data['status']['error_message']}")
-                return False
-                
-            # Check if the coin ID exists in the response
-            if 'data' not in data or str(coin_id) not in data['data']:
-                logger.error(f"Coin ID {coin_id} not found in API response")
-                return False
-                
-            coin_data = data['data'][str(coin_id)]
-            
-            # Add to tokens list
-            self.tokens[coin_id] = {
-                "name": coin_data["name"],
-                "symbol": coin_data["symbol"]
-            }
-            self.save_tokens()
-            
-            # Add to watchlist with current time
-            current_time = datetime.now()
-            
-            # Create new entry for this coin only
-            new_entry = {
-                "short_term": {
-                    "last_price": None,
-                    "last_notification_time": current_time.isoformat()
-                },
-                "long_term": {
-                    "last_price": None,
-                    "last_notification_time": current_time.isoformat()
-                },
-                "name": coin_data["name"],
-                "symbol": coin_data["symbol"]
-            }
-            
-            # Update only this coin in the watchlist file
-            watchlist_data[str(coin_id)] = new_entry
-            
-            # Use file locking to prevent conflicts
-            with FileLock("watchlist.json.lock"):
-                with open("watchlist.json", "w") as f:
-                    json.dump(watchlist_data, f, indent=2, sort_keys=True)
-            
-            logger.info(f"Added {coin_data['name']} ({coin_data['symbol']}) to tokens list and watchlist")
-            return True
-        except Exception as e:
-            logger.error(f"Error adding coin {coin_id}: {e}")
-            logger.error(f"Full error: {str(e)}")
-            return False
-            
-    def remove_coin(self, coin_id: int) -> bool:
-        try:
-            # Check if coin exists in the watchlist file directly
-            watchlist_data = {}
-            if os.path.exists("watchlist.json") and os.path.getsize("watchlist.json") > 0:
-                with open("watchlist.json", "r") as f:
-                    watchlist_data = json.load(f)
-                    
-                    # Check if coin exists
-                    if str(coin_id) not in watchlist_data:
-                        logger.info(f"Coin ID {coin_id} not found in watchlist")
-                        return False
+                return {}
+
+        return {int(k): v for k, v in data.get('data', {}).items()}
+
+    def resolve_coins(self, queries: List[str], exact: bool = False):
+        """Map ids, symbols, slugs or names to coin ids. Returns (ids, unresolved queries)
+
+        With exact, as for removals, a query must be an id or match a symbol, slug or name in full,
+        and a watched coin wins over the rest of the map.
+        """
+        coin_ids, unresolved = [], []
+        for query in queries:
+            coin_id = self._match_watched(query) if exact else None
+            if coin_id is None:
+                coin_id = self.metadata.resolve(query, fuzzy=not exact)
+            if coin_id is None:
+                unresolved.append(query)
             else:
-                logger.info("Watchlist file doesn't exist or is empty")
-                return False
-            
-            # Remove only this coin from the watchlist file
-            coin_info = watchlist_data.pop(str(coin_id), None)
-            
-            if not coin_info:
-                logger.info(f"Coin ID {coin_id} not found in watchlist")
-                return False
-            
-            # Use file locking to prevent conflicts
-            with FileLock("watchlist.json.lock"):
-                with open("watchlist.json", "w") as f:
-                    json.dump(watchlist_data, f, indent=2, sort_keys=True)
-            
-            # Also remove from tokens if it exists
-            if coin_id in self.tokens:
-                del self.tokens[coin_id]
-                self.save_tokens()
-            
-            logger.info(f"Removed coin ID {coin_id} from watchlist")
-            return True
-        except Exception as e:
-            logger.error(f"Error removing coin {coin_id}: {e}")
-            return False
+                coin_ids.append(coin_id)
+        return coin_ids, unresolved
+
+    def _match_watched(self, query: str):
+        """Id of the watched coin whose symbol or name is exactly query, if any"""
+        query = query.strip().lower()
+        with self._lock:
+            for coin_id, info in self.watchlist.items():
+                if info["symbol"].lower() == query or info["name"].lower() == query:
+                    return coin_id
+        return None
+
+    def remove_coin(self, coin_id: int) -> bool:
+        return coin_id in self.remove_coins([coin_id])["removed"]
+
+    def remove_coins(self, coin_ids: List[int]) -> Dict[str, List[int]]:
+        """Remove many coins at once. Returns the removed ids and the ones not being watched"""
+        result = {"removed": [], "missing": []}
+        with self._lock:
+            for coin_id in dict.fromkeys(coin_ids):
+                # Remove only this coin from the watchlist
+                coin_info = self.watchlist.pop(coin_id, None)
+
+                if not coin_info:
+                    logger.info(f"Coin ID {coin_id} not found in watchlist")
+                    result["missing"].append(coin_id)
+                    continue
+                self._dirty_coins.add(coin_id)
+                self.price_history.pop(coin_id, None)
+                self.window_extrema.pop(coin_id, None)
+                self._evaluated_quotes.pop(coin_id, None)
+                self.coin_tiers.pop(coin_id, None)
+
+                # Also remove from tokens if it exists
+                if coin_id in self.tokens:
+                    del self.tokens[coin_id]
+                    self._dirty_tokens.add(coin_id)
+                result["removed"].append(coin_id)
+            if result["removed"]:
+                self.watchlist_version += 1
+
+        if result["removed"]:
+            logger.info(f"Removed {len(result['removed'])} coins from watchlist: {result['removed']}")
+        return result
 
     def load_watchlist(self):
         try:
-            if os.path.exists("watchlist.json") and os.path.getsize("watchlist.json") > 0:
-                with open("watchlist.json", "r") as f:
-                    data = json.load(f)
-                    
-                    # Start with an empty watchlist
-                    watchlist = {}
-                    
-                    # Process each coin in the data
-                    for coin_id_str, info in data.items():
-                        try:
-                            coin_id = int(coin_id_str)
-                            
-                            # Validate required fields
-                            if not all(k in info for k in ["short_term", "long_term", "name", "symbol"]):
-                                logger.warning(f"Skipping coin {coin_id_str} due to missing required fields")
-                                continue
-                                
-                            # Convert datetime strings to datetime objects
-                            short_term_time = info["short_term"]["last_notification_time"]
-                            long_term_time = info["long_term"]["last_notification_time"]
-                            
-                            watchlist[coin_id] = {
-                                "short_term": {
-                                    "last_price": info["short_term"]["last_price"],
-                                    "last_notification_time": datetime.fromisoformat(short_term_time)
-                                },
-                                "long_term": {
-                                    "last_price": info["long_term"]["last_price"],
-                                    "last_notification_time": datetime.fromisoformat(long_term_time)
-                                },
-                                "name": info["name"],
-                                "symbol": info["symbol"]
-                            }
-                        except Exception as e:
-                            logger.error(f"Error processing coin {coin_id_str} in watchlist: {e}")
-                            # Skip this coin but continue processing others
-                            continue
-                            
-                logger.info(f"Loaded watchlist with {len(watchlist)} coins")
-                return watchlist
-            else:
-                logger.info("No existing watchlist found or file is empty")
-                return {}
-        except FileNotFoundError:
-            logger.info("No existing watchlist found, using empty watchlist")
-            return {}
-        except json.JSONDecodeError:
-            logger.error("Watchlist file exists but is not valid JSON, using empty watchlist")
-            return {}
+            return self.storage.load_watchlist()
         except Exception as e:
             logger.error(f"Error loading watchlist: {e}")
             return {}
 
-    def save_watchlist(self, watchlist):
+    def _take_dirty(self):
+        """Snapshot and clear pending changes. Removed coins and tokens are returned as None entries"""
+        with self._lock:
+            return self._take_dirty_locked()
+
+    def _take_dirty_locked(self):
+        coins = {}
+        for coin_id in self._dirty_coins:
+            info = self.watchlist.get(coin_id)
+            coins[coin_id] = serialize_watchlist_entry(info) if info else None
+        self._dirty_coins = set()
+
+        tokens = {}
+        for token_id in self._dirty_tokens:
+            token = self.tokens.get(token_id)
+            tokens[token_id] = dict(token) if token else None
+        self._dirty_tokens = set()
+
+        notifications, self._pending_notifications = self._pending_notifications, []
+        return coins, tokens, notifications
+
+    def _write_dirty(self, coins: Dict, tokens: Dict, notifications: List[Dict]):
+        """Write a dirty snapshot to storage, re-queueing it if the write fails"""
         try:
-            data = {}
-            for coin_id, info in watchlist.items():
-                data[str(coin_id)] = {
-                    "symbol": info["symbol"],
-                    "name": info["name"],
-                    "short_term": {
-                        "last_price": info["short_term"]["last_price"],
-                        "last_notification_time": info["short_term"]["last_notification_time"].isoformat()
-                    },
-                    "long_term": {
-                        "last_price": info["long_term"]["last_price"],
-                        "last_notification_time": info["long_term"]["last_notification_time"].isoformat()
-                    }
-                }
-            
-            # Use file locking to prevent conflicts
-            with FileLock("watchlist.json.lock"):
-                with open("watchlist.json", "w") as f:
-                    json.dump(data, f, indent=2, sort_keys=True)
-                    
-            logger.info("Watchlist updated with new prices")
+            # Alerts must be durable before the anchors that moved past them
+            if self.outbox is not None:
+                self.outbox.sync()
+            self.storage.write_changes(coins, tokens, notifications)
         except Exception as e:
             logger.error(f"Error saving watchlist: {e}")
+            with self._lock:
+                self._dirty_coins.update(coins.keys())
+                self._dirty_tokens.update(tokens.keys())
+                self._pending_notifications[:0] = notifications
+
+    def flush(self):
+        """Write pending watchlist and token changes to disk"""
+        self._write_dirty(*self._take_dirty())
+
+    async def flush_async(self):
+        """Snapshot pending changes on the event loop and write them from a worker thread"""
+        coins, tokens, notifications = self._take_dirty()
+        if coins or tokens or notifications:
+            await asyncio.to_thread(self._write_dirty, coins, tokens, notifications)
+
+    def record_price_history(self, prices: Dict[int, float], timestamp: float):
+        """Append one sample per priced coin to its ring buffer"""
+        for coin_id, price in prices.items():
+            if coin_id not in self.watchlist:
+                continue
+            history = self.price_history.get(coin_id)
+            if history is None:
+                history = self.price_history[coin_id] = PriceHistory(self.history_capacity)
+            history.append(timestamp, price)
+
+    def _windows(self, coin_id: int) -> List[WindowExtrema]:
+        windows = self.window_extrema.get(coin_id)
+        if windows is None:
+            windows = self.window_extrema[coin_id] = [
+                WindowExtrema(threshold["minutes"] * 60) for threshold in SHORT_TERM_WINDOWS
+            ]
+        return windows
+
+    def _check_windows(self, coin_ids: List[int], prices: List[float], result: Dict, timestamp: float) -> Dict[int, tuple]:
+        """Push this tick into every coin's short-term windows and return the column indices
+        whose largest move inside a window reaches that window's percent, as (change, seconds)"""
+        hits = {}
+        for i, coin_id in enumerate(coin_ids):
+            if not result["valid"][i]:
+                continue
+            windows = self._windows(coin_id)
+            for window, threshold in zip(windows, SHORT_TERM_WINDOWS):
+                window.push(timestamp, prices[i])
+                if i in hits or result["short_term"][i]:
+                    continue
+                change, elapsed_seconds = window.move(timestamp, prices[i])
+                if abs(change) >= threshold["percent"]:
+                    hits[i] = (change, elapsed_seconds)
+        return hits
+
+    def open_outbox(self, path: str = OUTBOX_FILE) -> List[Dict]:
+        """Start recording alerts in the outbox and return the ones left unsent by the last run.
+
+        An outbox that is still open is reused, since replaying the log again would rewrite it
+        without the records not yet synced.
+        """
+        with self._lock:
+            if self.outbox is None or self.outbox.path != path:
+                self.close_outbox()
+                self.outbox = Outbox(path)
+            return self.outbox.pending()
+
+    def mark_sent(self, notif: Dict):
+        """Acknowledge a delivered alert or digest in the outbox and queue it for the sent history"""
+        sent_at = datetime.now().isoformat()
+        with self._lock:
+            if self.outbox is not None:
+                self.outbox.mark_sent(notif)
+            for item in notif.get("notifications") or [notif]:
+                self._pending_notifications.append({
+                    "coin_id": item["coin_id"],
+                    "type": item["type"],
+                    "price_change": item["price_change"],
+                    "current_price": item["current_price"],
+                    "created_at": item.get("triggered_at", sent_at),
+                    "sent_at": sent_at
+                })
+
+    def mark_failed(self, notif: Dict):
+        """Count a delivery run the notifier gave up on, which leaves the alerts in the outbox for a re-submit"""
+        with self._lock:
+            dead = self.outbox.mark_failed(notif) if self.outbox is not None else 0
+        if dead:
+            logger.error(f"❌🔴⚠️ TELEGRAM ERROR ⚠️🔴❌ Dropped {dead} notifications from the outbox after {OUTBOX_MAX_FAILED_RUNS} failed delivery runs")
+
+    def unsent_notifications(self, held: List[Dict] = ()) -> List[Dict]:
+        """Alerts still unsent in the outbox, except the ones held in a digest buffer"""
+        held_ids = {notif.get("outbox_id") for notif in held}
+        with self._lock:
+            pending = self.outbox.pending() if self.outbox is not None else []
+        return [notif for notif in pending if notif.get("outbox_id") not in held_ids]
+
+    def close_outbox(self):
+        """Sync and close the outbox once nothing more will be sent through it"""
+        with self._lock:
+            outbox, self.outbox = self.outbox, None
+        if outbox is not None:
+            outbox.close()
+
+    def close(self):
+        """Flush pending changes and release the storage backend and the CMC session"""
+        self.flush()
+        self.storage.close()
+        self.close_outbox()
+        self.cmc.close()
+        if PRICE_HISTORY_FILE:
+            save_histories(PRICE_HISTORY_FILE, self.price_history)
+
+    async def run_write_behind(self, interval: float = WATCHLIST_FLUSH_INTERVAL):
+        """Flush pending changes every interval seconds, and once more when cancelled"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await self.flush_async()
+        finally:
+            self.flush()
 
     def get_coin_price(self, coin_ids: List[int]) -> Dict[int, float]:
-        max_retries = 3
-        retry_count = 0
-        
-        while retry_count < max_retries:
-            try:
-                batches = [coin_ids[i:i + BATCH_SIZE] for i in range(0, len(coin_ids), BATCH_SIZE)]
-                total_batches = len(batches)
-                logger.info(f"Sending {total_batches} batch{'es' if total_batches > 1 else ''} to CoinMarketCap API (attempt {retry_count + 1}/{max_retries})")
-                
-                all_prices = {}
-                for i, batch in enumerate(batches, 1):
-                    logger.info(f"Processing batch {i}/{total_batches} with {len(batch)} coins")
-                    headers = {
-                        'X-CMC_PRO_API_KEY': CMC_API_KEY,
-                        'Accept': 'application/json'
-                    }
-                    params = {
-                        'id': ','.join(map(str, batch)),
-                        'convert': 'USD'
-                    }
-                    response = requests.get(f"{CMC_BASE_URL}/cryptocurrency/quotes/latest", headers=headers, params=params)
-                    data = response.json()
-                    batch_prices = {int(k): float(v['quote']['USD']['price']) for k, v in data['data'].items()}
+        if self.budget.blocked():
+            logger.warning("Skipping price fetch while the CMC rate limit backoff is active")
+            return {}
+        batch_size = self.budget.batch_size(len(coin_ids))
+        batches = [coin_ids[i:i + batch_size] for i in range(0, len(coin_ids), batch_size)]
+        total_batches = len(batches)
+        if not batches:
+            return {}
+        logger.info(f"Sending {total_batches} batch{'es' if total_batches > 1 else ''} to CoinMarketCap API")
+
+        # Batches run concurrently, each one retrying on its own
+        all_prices = {}
+        failed_batches = 0
+        workers = min(FETCH_CONCURRENCY, total_batches)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cmc-batch") as executor:
+            futures = [executor.submit(self._fetch_price_batch, batch, i, total_batches) for i, batch in enumerate(batches, 1)]
+            for future in futures:
+                batch_prices = future.result()
+                if batch_prices is None:
+                    failed_batches += 1
+                else:
                     all_prices.update(batch_prices)
-                
-                return all_prices
+
+        if failed_batches:
+            logger.error(f"Failed to fetch {failed_batches}/{total_batches} batches, returning partial prices for {len(all_prices)} coins")
+
+        self.log_latency()
+        self.log_credit_usage()
+        return all_prices
+
+    def log_latency(self):
+        quote_stats = self.cmc.get_latency_stats().get("/cryptocurrency/quotes/latest")
+        if quote_stats:
+            logger.info(
+                f"CMC quotes latency: last {quote_stats['last_seconds']:.3f}s "
+                f"avg {quote_stats['avg_seconds']:.3f}s max {quote_stats['max_seconds']:.3f}s "
+                f"over {quote_stats['requests']} requests ({quote_stats['errors']} errors)"
+            )
+
+    def log_credit_usage(self):
+        report = self.budget.report()
+        logger.info(
+            f"CMC credits: {report['day_credits']} in the last day, projected {report['projected_monthly_credits']}"
+            f"/{report['monthly_credits']} per month, {report['minute_calls']}/{report['calls_per_minute']} calls this minute"
+        )
+
+    def _fetch_price_batch(self, batch: List[int], batch_number: int, total_batches: int):
+        """Fetch one batch of quotes, retrying only this batch. Returns None when every attempt fails"""
+        params = {
+            'id': ','.join(map(str, batch)),
+            'convert': 'USD'
+        }
+        for attempt in range(1, MAX_FETCH_RETRIES + 1):
+            try:
+                logger.info(f"Processing batch {batch_number}/{total_batches} with {len(batch)} coins (attempt {attempt}/{MAX_FETCH_RETRIES})")
+                data = self.cmc.get("/cryptocurrency/quotes/latest", params=params)
+                return self._parse_quotes(data)
+            except CMCRateLimitError:
+                # Retrying would only spend more of the limit, the budget pauses calls instead
+                return None
+            except Exception as e:
+                logger.error(f"Error fetching batch {batch_number}/{total_batches} (attempt {attempt}/{MAX_FETCH_RETRIES}): {e}")
+                if attempt < MAX_FETCH_RETRIES:
+                    time.sleep(FETCH_RETRY_DELAY)
+        logger.error(f"Failed to fetch batch {batch_number}/{total_batches} after {MAX_FETCH_RETRIES} attempts")
+        return None
+
+    async def get_coin_price_async(self, coin_ids: List[int]) -> Dict[int, float]:
+        """Async counterpart of get_coin_price, bounded by FETCH_CONCURRENCY"""
+        if self.budget.blocked():
+            logger.warning("Skipping price fetch while the CMC rate limit backoff is active")
+            return {}
+        batch_size = self.budget.batch_size(len(coin_ids))
+        batches = [coin_ids[i:i + batch_size] for i in range(0, len(coin_ids), batch_size)]
+        total_batches = len(batches)
+        if not batches:
+            return {}
+        logger.info(f"Sending {total_batches} batch{'es' if total_batches > 1 else ''} to CoinMarketCap API")
+
+        semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def fetch(batch, batch_number):
+            async with semaphore:
+                return await self._fetch_price_batch_async(batch, batch_number, total_batches)
+
+        results = await asyncio.gather(*(fetch(batch, i) for i, batch in enumerate(batches, 1)))
+
+        all_prices = {}
+        failed_batches = 0
+        for batch_prices in results:
+            if batch_prices is None:
+                failed_batches += 1
+            else:
+                all_prices.update(batch_prices)
+
+        if failed_batches:
+            logger.error(f"Failed to fetch {failed_batches}/{total_batches} batches, returning partial prices for {len(all_prices)} coins")
+        self.log_latency()
+        self.log_credit_usage()
+        return all_prices
+
+    async def _fetch_price_batch_async(self, batch: List[int], batch_number: int, total_batches: int):
+        params = {
+            'id': ','.join(map(str, batch)),
+            'convert': 'USD'
+        }
+        for attempt in range(1, MAX_FETCH_RETRIES + 1):
+            try:
+                logger.info(f"Processing batch {batch_number}/{total_batches} with {len(batch)} coins (attempt {attempt}/{MAX_FETCH_RETRIES})")
+                data = await self.cmc.get_async("/cryptocurrency/quotes/latest", params=params)
+                return self._parse_quotes(data)
+            except CMCRateLimitError:
+                return None
             except Exception as e:
-                retry_count += 1
-                logger.error(f"Error fetching prices (attempt {retry_count}/{max_retries}): {e}")
-                if retry_count >= max_retries:
-                    logger.error(f"Failed to fetch prices after {max_retries} attempts")
-                    return {}
-                time.sleep(2)  # Wait 2 seconds before retrying
-
-    def send_telegram_notification(self, message: str):
+                logger.error(f"Error fetching batch {batch_number}/{total_batches} (attempt {attempt}/{MAX_FETCH_RETRIES}): {e}")
+                if attempt < MAX_FETCH_RETRIES:
+                    await asyncio.sleep(FETCH_RETRY_DELAY)
+        logger.error(f"Failed to fetch batch {batch_number}/{total_batches} after {MAX_FETCH_RETRIES} attempts")
+        return None
+
+    def _parse_quotes(self, data: Dict) -> Dict[int, float]:
+        prices = {}
+        for k, v in data['data'].items():
+            quote = v['quote']['USD']
+            prices[int(k)] = float(quote['price'])
+            # CMC often serves the same quote again, its timestamp tells us if anything moved
+            self.quote_updated[int(k)] = quote.get('last_updated') or v.get('last_updated')
+            self.change_24h[int(k)] = quote.get('percent_change_24h')
+        return prices
+
+    def send_telegram_notification(self, message: str) -> bool:
         try:
             url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
             data = {
@@ -313,18 +637,113 @@ class PriceMonitor:
                 "parse_mode": "HTML"
             }
             response = requests.post(url, json=data)
+            if response.status_code == 429:
+                raise TelegramRetryAfter(response.json().get('parameters', {}).get('retry_after', 1))
             if not response.json().get('ok'):
                 logger.error(f"❌🔴⚠️ TELEGRAM ERROR ⚠️🔴❌ Failed to send Telegram notification: {response.text}")
+                return False
+            return True
+        except TelegramRetryAfter:
+            raise
+        except Exception as e:
+            logger.error(f"❌🔴⚠️ TELEGRAM ERROR ⚠️🔴❌ Error sending Telegram notification: {e}")
+            return False
+
+    async def send_telegram_notification_async(self, bot, message: str) -> bool:
+        """Send a notification through the running bot instead of a blocking HTTP call"""
+        try:
+            await bot.send_message(chat_id=TG_CHAT_ID, text=message, parse_mode="HTML")
+            return True
+        except RetryAfter as e:
+            # Let the notification queue wait it out and re-queue the message
+            raise TelegramRetryAfter(e.retry_after) from e
         except Exception as e:
             logger.error(f"❌🔴⚠️ TELEGRAM ERROR ⚠️🔴❌ Error sending Telegram notification: {e}")
+            return False
 
-    def check_price_movements(self) -> List[Dict]:
-        watchlist = self.load_watchlist()
-        if not watchlist:
+    def check_price_movements(self, coin_ids: List[int] = None) -> List[Dict]:
+        """Fetch and evaluate the given coins, or the whole watchlist"""
+        if coin_ids is None:
+            coin_ids = list(self.watchlist.keys())
+        if not coin_ids:
             return []
 
+        try:
+            # Get current prices from API
+            current_prices = self.get_coin_price(coin_ids)
+            
+        except Exception as e:
+            logger.error(f"Failed to get current prices: {e}")
+            return []
+
+        return self._evaluate_price_movements(current_prices, coin_ids)
+
+    async def check_price_movements_async(self, coin_ids: List[int] = None) -> List[Dict]:
+        """Async counterpart of check_price_movements for use on the bot's event loop"""
+        if coin_ids is None:
+            coin_ids = list(self.watchlist.keys())
+        if not coin_ids:
+            return []
+
+        try:
+            current_prices = await self.get_coin_price_async(coin_ids)
+        except Exception as e:
+            logger.error(f"Failed to get current prices: {e}")
+            return []
+
+        return self._evaluate_price_movements(current_prices, coin_ids)
+
+    def get_coin_tier(self, coin_id: int) -> str:
+        return self.pinned_tiers.get(coin_id) or self.coin_tiers.get(coin_id, DEFAULT_POLL_TIER)
+
+    def set_coin_tier(self, coin_id: int, tier: str):
+        """Pin a coin to a tier, overriding dynamic tiering"""
+        if tier not in POLL_TIERS:
+            raise ValueError(f"Unknown poll tier '{tier}'")
+        self.pinned_tiers[coin_id] = tier
+
+    def _assign_tiers(self, coin_ids: List[int], result: Dict, fired: np.ndarray, timestamp: float):
+        """Re-tier evaluated coins by how close they are to firing a rule and how much they moved lately"""
+        abs_short = np.abs(result["short_term_change"])
+        abs_long = np.abs(result["long_term_change"])
+        # Fraction of the way to the nearest rule; 1.0 means it fires
+        proximity = np.maximum.reduce([
+            abs_short / SHORT_TERM_RULES.required_percents(result["short_term_elapsed"]),
+            abs_long / LONG_TERM_RULES.required_percents(result["long_term_elapsed"]),
+            abs_short / ABSOLUTE_CHANGE_PERCENT
+        ])
+
+        since = timestamp - TIERING_VOLATILITY_WINDOW
+        for i, coin_id in enumerate(coin_ids):
+            if not result["valid"][i]:
+                continue
+            history = self.price_history.get(coin_id)
+            volatility = history.max_move(since) if history else 0.0
+
+            # A coin that just fired is likely to keep moving
+            if fired[i] or proximity[i] >= HOT_PROXIMITY or volatility >= HOT_VOLATILITY_PERCENT:
+                self.coin_tiers[coin_id] = "hot"
+            elif proximity[i] <= TAIL_PROXIMITY and volatility <= TAIL_VOLATILITY_PERCENT:
+                self.coin_tiers[coin_id] = "tail"
+            else:
+                self.coin_tiers[coin_id] = DEFAULT_POLL_TIER
+
+    def coins_due(self, due_tiers) -> List[int]:
+        """Watchlist coins whose poll tier is due this tick"""
+        with self._lock:
+            tiers = {coin_id: self.get_coin_tier(coin_id) for coin_id in self.watchlist}
+        due = {coin_id: tier for coin_id, tier in tiers.items() if tier in due_tiers}
+        admitted = self.budget.throttle(Counter(due.values()))
+        return [coin_id for coin_id, tier in due.items() if tier in admitted]
+
+    def _evaluate_price_movements(self, current_prices: Dict[int, float], coin_ids: List[int] = None) -> List[Dict]:
+        """Apply the threshold rules to fresh prices for the polled coins, updating anchors in memory"""
+        with self._lock:
+            return self._evaluate_locked(current_prices, coin_ids)
+
+    def _evaluate_locked(self, current_prices: Dict[int, float], coin_ids: List[int] = None) -> List[Dict]:
+        watchlist = self.watchlist
         notifications = []
-        watchlist_updated = False
         current_time = datetime.now()
         
         short_term_matches = []
@@ -333,18 +752,19 @@ class PriceMonitor:
         significant_changes = []
         absolute_notifications = []
 
-        try:
-            # Get current prices from API
-            coin_ids = list(watchlist.keys())
-            current_prices = self.get_coin_price(coin_ids)
-            
-        except Exception as e:
-            logger.error(f"Failed to get current prices: {e}")
-            return []
+        self.record_price_history(current_prices, current_time.timestamp())
 
-        # Process all coins in the watchlist
-        for coin_id in list(watchlist.keys()):
+        # Gather the coins to evaluate into columns, initialising new coins on the way.
+        # change_log keeps the log order: a message for initialised coins, a column index otherwise
+        change_log = []
+        skipped = 0
+        polled = list(watchlist.keys()) if coin_ids is None else coin_ids
+        coin_ids, current, st_price, st_time, lt_price, lt_time = [], [], [], [], [], []
+        for coin_id in polled:
             try:
+                # Coins removed while their prices were being fetched
+                if coin_id not in watchlist:
+                    continue
                 coin_info = watchlist[coin_id]
                 
                 # If we didn't get a price for this coin, log it but don't skip
@@ -356,98 +776,130 @@ class PriceMonitor:
                 current_price = current_prices[coin_id]
                 
                 # Check if this is a new coin (with blank/None price data)
-                if watchlist[coin_id]["short_term"]["last_price"] is None or watchlist[coin_id]["long_term"]["last_price"] is None:
+                if coin_info["short_term"]["last_price"] is None or coin_info["long_term"]["last_price"] is None:
                     logger.info(f"Initializing price data for {coin_info['symbol']} (ID: {coin_id}) at ${current_price:.4f}")
-                    watchlist[coin_id]["short_term"]["last_price"] = current_price
-                    watchlist[coin_id]["long_term"]["last_price"] = current_price
-                    watchlist[coin_id]["short_term"]["last_notification_time"] = current_time
-                    watchlist[coin_id]["long_term"]["last_notification_time"] = current_time
-                    significant_changes.append(f"{coin_info['symbol']}: Initial price ${current_price:.4f}")
-                    watchlist_updated = True
+                    coin_info["short_term"]["last_price"] = current_price
+                    coin_info["long_term"]["last_price"] = current_price
+                    coin_info["short_term"]["last_notification_time"] = current_time
+                    coin_info["long_term"]["last_notification_time"] = current_time
+                    change_log.append(f"{coin_info['symbol']}: Initial price ${current_price:.4f}")
+                    self._dirty_coins.add(coin_id)
+                    self._evaluated_quotes[coin_id] = (self.quote_updated.get(coin_id), current_price)
                     continue
 
-                short_term_price = watchlist[coin_id]["short_term"]["last_price"]
-                long_term_price = watchlist[coin_id]["long_term"]["last_price"]
-                
-                short_term_change_percent = ((current_price - short_term_price) / short_term_price) * 100
-                long_term_change_percent = ((current_price - long_term_price) / long_term_price) * 100
-
-                # Always log all price changes regardless of significance
-                significant_changes.append(
-                    f"{coin_info['symbol']}: ${current_price:.4f} "
-                    f"ST: {short_term_change_percent:.2f}% "
-                    f"LT: {long_term_change_percent:.2f}% "
-                    f"ABS: {abs(short_term_change_percent):.2f}%"
-                )
-
-                if abs(short_term_change_percent) >= 2.0:
-                    absolute_matches.append(f"{coin_info['symbol']}({abs(short_term_change_percent):.1f}%)")
-                    # Create absolute notification object
-                    absolute_notification = {
-                        "coin_name": coin_info["name"],
-                        "coin_symbol": coin_info["symbol"],
-                        "current_price": current_price,
-                        "price_change": short_term_change_percent,
-                        "type": "absolute",
-                        "coin_id": coin_id
-                    }
-                    # Add to a separate list for now, will check for overlaps later
-                    absolute_notifications.append(absolute_notification)
-                    
-                short_term_matched = False
-                for threshold in SHORT_TERM_THRESHOLDS:
-                    short_term_time = watchlist[coin_id]["short_term"]["last_notification_time"]
-                    if isinstance(short_term_time, str):
-                        short_term_time = datetime.fromisoformat(short_term_time)
-                    short_term_time_elapsed = current_time - short_term_time
-                    
-                    if (abs(short_term_change_percent) >= threshold["percent"] and 
-                          short_term_time_elapsed <= timedelta(minutes=threshold["minutes"])):
-                        short_term_matches.append(f"{coin_info['symbol']}({abs(short_term_change_percent):.1f}%)")
-                        notification = {
-                            "coin_name": coin_info["name"],
-                            "coin_symbol": coin_info["symbol"],
-                            "current_price": current_price,
-                            "price_change": short_term_change_percent,
-                            "time_elapsed": short_term_time_elapsed,
-                            "type": "short_term",
-                            "coin_id": coin_id
-                        }
-                        notifications.append(notification)
-                        short_term_matched = True
-                        break
-
-                for threshold in LONG_TERM_THRESHOLDS:
-                    long_term_time = watchlist[coin_id]["long_term"]["last_notification_time"]
-                    if isinstance(long_term_time, str):
-                        long_term_time = datetime.fromisoformat(long_term_time)
-                    long_term_time_elapsed = current_time - long_term_time
-                    
-                    if (abs(long_term_change_percent) >= threshold["percent"] and 
-                          long_term_time_elapsed <= timedelta(minutes=threshold["minutes"])):
-                        long_term_matches.append(f"{coin_info['symbol']}({abs(long_term_change_percent):.1f}%)")
-                        notification = {
-                            "coin_name": coin_info["name"],
-                            "coin_symbol": coin_info["symbol"],
-                            "current_price": current_price,
-                            "price_change": long_term_change_percent,
-                            "time_elapsed": long_term_time_elapsed,
-                            "type": "long_term",
-                            "coin_id": coin_id
-                        }
-                        notifications.append(notification)
-                        
-                        # Update the long-term price in the watchlist
-                        watchlist[coin_id]["long_term"] = {
-                            "last_price": current_price,
-                            "last_notification_time": current_time
-                        }
-                        watchlist_updated = True
-                        break
+                # An unchanged quote cannot newly fire: the required percent only grows with elapsed time,
+                # and a window's move to the same price only shrinks as older samples leave it
+                if INCREMENTAL_EVALUATION:
+                    quote = (self.quote_updated.get(coin_id), current_price)
+                    if self._evaluated_quotes.get(coin_id) == quote:
+                        skipped += 1
+                        if WINDOWED_DETECTION:
+                            # Only the rules are skipped, the windows still need this tick's sample
+                            for window in self._windows(coin_id):
+                                window.push(current_time.timestamp(), current_price)
+                        continue
+                    self._evaluated_quotes[coin_id] = quote
 
+                change_log.append(len(coin_ids))
+                coin_ids.append(coin_id)
+                current.append(current_price)
+                st_price.append(coin_info["short_term"]["last_price"])
+                st_time.append(coin_info["short_term"]["last_notification_time"])
+                lt_price.append(coin_info["long_term"]["last_price"])
+                lt_time.append(coin_info["long_term"]["last_notification_time"])
             except Exception as e:
                 logger.error(f"Error processing coin {coin_id}: {e}")
 
+        columns = PriceColumns(coin_ids, current, st_price, st_time, lt_price, lt_time)
+        result = rule_engine.evaluate(columns, current_time, SHORT_TERM_RULES, LONG_TERM_RULES, ABSOLUTE_CHANGE_PERCENT)
+        short_term_change = result["short_term_change"]
+        long_term_change = result["long_term_change"]
+
+        # Exact "moved X% within Y minutes" over the sample stream, on top of the anchor rule
+        window_hits = {}
+        if WINDOWED_DETECTION:
+            window_hits = self._check_windows(coin_ids, current, result, current_time.timestamp())
+        windowed = np.zeros(len(columns), dtype=bool)
+        windowed[list(window_hits)] = True
+
+        # Always log all price changes regardless of significance
+        for entry in change_log:
+            if isinstance(entry, str):
+                significant_changes.append(entry)
+                continue
+            if not result["valid"][entry]:
+                logger.error(f"Error processing coin {coin_ids[entry]}: anchor price is zero")
+                continue
+            significant_changes.append(
+                f"{watchlist[coin_ids[entry]]['symbol']}: ${current[entry]:.4f} "
+                f"ST: {short_term_change[entry]:.2f}% "
+                f"LT: {long_term_change[entry]:.2f}% "
+                f"ABS: {abs(short_term_change[entry]):.2f}%"
+            )
+
+        # Only coins that matched a rule need notification objects
+        fired = result["valid"] & (result["short_term"] | windowed | result["long_term"] | result["absolute"])
+        for i in np.flatnonzero(fired):
+            coin_id = coin_ids[i]
+            coin_info = watchlist[coin_id]
+            current_price = current[i]
+
+            if result["absolute"][i]:
+                absolute_matches.append(f"{coin_info['symbol']}({abs(short_term_change[i]):.1f}%)")
+                # Add to a separate list for now, will check for overlaps later
+                absolute_notifications.append({
+                    "coin_name": coin_info["name"],
+                    "coin_symbol": coin_info["symbol"],
+                    "current_price": current_price,
+                    "price_change": float(short_term_change[i]),
+                    "type": "absolute",
+                    "coin_id": coin_id
+                })
+
+            if result["short_term"][i] or windowed[i]:
+                if result["short_term"][i]:
+                    change = float(short_term_change[i])
+                    time_elapsed = timedelta(microseconds=int(result["short_term_elapsed"][i]))
+                else:
+                    change, elapsed_seconds = window_hits[i]
+                    time_elapsed = timedelta(seconds=elapsed_seconds)
+                short_term_matches.append(f"{coin_info['symbol']}({abs(change):.1f}%)")
+                notifications.append({
+                    "coin_name": coin_info["name"],
+                    "coin_symbol": coin_info["symbol"],
+                    "current_price": current_price,
+                    "price_change": change,
+                    "time_elapsed": time_elapsed,
+                    "type": "short_term",
+                    "coin_id": coin_id
+                })
+
+            if result["long_term"][i]:
+                long_term_matches.append(f"{coin_info['symbol']}({abs(long_term_change[i]):.1f}%)")
+                notifications.append({
+                    "coin_name": coin_info["name"],
+                    "coin_symbol": coin_info["symbol"],
+                    "current_price": current_price,
+                    "price_change": float(long_term_change[i]),
+                    "time_elapsed": timedelta(microseconds=int(result["long_term_elapsed"][i])),
+                    "type": "long_term",
+                    "coin_id": coin_id
+                })
+                
+                # Update the long-term price in the watchlist
+                watchlist[coin_id]["long_term"] = {
+                    "last_price": current_price,
+                    "last_notification_time": current_time
+                }
+                self._dirty_coins.add(coin_id)
+
+        if DYNAMIC_TIERING:
+            self._assign_tiers(coin_ids, result, fired, current_time.timestamp())
+            tier_counts = {tier: 0 for tier in POLL_TIERS}
+            for coin_id in watchlist:
+                tier_counts[self.get_coin_tier(coin_id)] += 1
+            logger.info("Poll tiers: " + ", ".join(f"{tier} {count}" for tier, count in tier_counts.items()))
+
         if significant_changes:
             logger.info("Price changes: " + " | ".join(significant_changes))
             
@@ -456,12 +908,21 @@ class PriceMonitor:
         logger.info(f"Long-term threshold matches ({len(long_term_matches)}): {', '.join(long_term_matches) if long_term_matches else 'None'}")
         logger.info(f"Absolute 2.5% changes ({len(absolute_matches)}): {', '.join(absolute_matches) if absolute_matches else 'None'}")
 
+        self.evaluation_stats["cycles"] += 1
+        self.evaluation_stats["evaluated"] += len(columns)
+        self.evaluation_stats["skipped"] += skipped
+        self.evaluation_stats["last_evaluated"] = len(columns)
+        self.evaluation_stats["last_skipped"] = skipped
+        if INCREMENTAL_EVALUATION:
+            logger.info(f"Incremental evaluation: {len(columns)} coins evaluated, {skipped} skipped with unchanged quotes")
+
         # Check for overlaps between short-term and absolute notifications
         logger.info("Checking for overlaps between short-term and absolute notifications...")
         overlaps = []
+        short_term_symbols = {notif["coin_symbol"] for notif in notifications if notif["type"] == "short_term"}
         for abs_notif in absolute_notifications:
             # If there's already a short-term notification for this coin, skip the absolute one
-            if any(notif["coin_symbol"] == abs_notif["coin_symbol"] and notif["type"] == "short_term" for notif in notifications):
+            if abs_notif["coin_symbol"] in short_term_symbols:
                 overlaps.append(abs_notif["coin_symbol"])
             else:
                 notifications.append(abs_notif)
@@ -496,17 +957,73 @@ class PriceMonitor:
                     "last_notification_time": current_time
                 }
                 logger.info(f"Updated short-term price for {notification['coin_symbol']} due to {notification['type']} notification")
-                watchlist_updated = True
+                self._dirty_coins.add(coin_id)
+
+                # Windows restart from the alert price, like the short-term anchor
+                for window in self.window_extrema.get(coin_id, ()):
+                    window.reset(current_time.timestamp(), notification["current_price"])
 
-        if watchlist_updated:
-            self.save_watchlist(watchlist)
+        if self.outbox is not None:
+            # The trigger time travels with the alert into the sent history
+            for notification in notifications:
+                notification["triggered_at"] = current_time.isoformat()
+            self.outbox.add(notifications)
 
         return notifications
 
+    def get_watchlist_view(self, sort: str = "symbol") -> List[Dict]:
+        """Watched coins for /list, sorted by "symbol", "move" (24h change) or "threshold" (distance to firing)"""
+        with self._lock:
+            version, coins = self._list_cache
+            if version != self.watchlist_version:
+                # Names and symbols only change on add or remove, so the sorted base list is reused until then
+                coins = sorted(
+                    ({"id": coin_id, "name": info.get("name", "Unknown"), "symbol": info.get("symbol", "Unknown")}
+                     for coin_id, info in self.watchlist.items()),
+                    key=lambda c: c["symbol"].upper()
+                )
+                self._list_cache = (self.watchlist_version, coins)
+            if sort == "symbol":
+                return coins
+
+            view = []
+            now = datetime.now()
+            for coin in coins:
+                entry = dict(coin)
+                entry["change_24h"] = self.change_24h.get(coin["id"])
+                entry["threshold_distance"] = self._threshold_distance(coin["id"], now)
+                view.append(entry)
+
+        if sort == "move":
+            key = lambda c: (c["change_24h"] is None, -abs(c["change_24h"] or 0))
+        elif sort == "threshold":
+            key = lambda c: (c["threshold_distance"] is None, c["threshold_distance"] or 0)
+        else:
+            raise ValueError(f"Unknown sort '{sort}'")
+        return sorted(view, key=key)
+
+    def _threshold_distance(self, coin_id: int, now: datetime):
+        """Percentage points the latest price still has to move before any rule fires, or None without data"""
+        history = self.price_history.get(coin_id)
+        info = self.watchlist.get(coin_id)
+        latest = history.latest() if history else None
+        if not latest or not info or not info["short_term"]["last_price"] or not info["long_term"]["last_price"]:
+            return None
+        price = latest[1]
+        short_change = abs(price - info["short_term"]["last_price"]) / info["short_term"]["last_price"] * 100
+        long_change = abs(price - info["long_term"]["last_price"]) / info["long_term"]["last_price"] * 100
+        microsecond = timedelta(microseconds=1)
+        return min(
+            SHORT_TERM_RULES.required_percent((now - info["short_term"]["last_notification_time"]) // microsecond) - short_change,
+            LONG_TERM_RULES.required_percent((now - info["long_term"]["last_notification_time"]) // microsecond) - long_change,
+            ABSOLUTE_CHANGE_PERCENT - short_change
+        )
+
     def get_monitored_coins(self) -> List[Dict]:
-        watchlist = self.load_watchlist()
         coins = []
-        for coin_id, coin_data in watchlist.items():
+        with self._lock:
+            watchlist = list(self.watchlist.items())
+        for coin_id, coin_data in watchlist:
             # Get coin info directly from watchlist as it now contains name and symbol
             coins.append({
                 "id": coin_id,
@@ -518,7 +1035,7 @@ class PriceMonitor:
     def get_coin_info(self, coin_id: int) -> Dict:
         """Get information about a specific coin from either watchlist or tokens"""
         # First check if coin is in watchlist
-        watchlist = self.load_watchlist()
+        watchlist = self.watchlist
         if coin_id in watchlist:
             return {
                 "id": coin_id,
@@ -538,100 +1055,112 @@ class PriceMonitor:
 def main():
     monitor = PriceMonitor()
     logger.info("Price monitoring started")
+
+    def deliver(notif: Dict) -> bool:
+        message = format_notification(notif)
+        # Only print to console, no need to duplicate the logging
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
+        if not monitor.send_telegram_notification(message):
+            return False
+        monitor.mark_sent(notif)
+        return True
+
+    # Sender threads deliver notifications so a burst never delays the next price check
+    notification_queue = ThreadedNotificationQueue(deliver, chat_id=TG_CHAT_ID, on_failed=monitor.mark_failed)
+    notification_queue.start()
+    digest = DigestBuffer(DIGEST_TYPES, DIGEST_WINDOW, format_digest_line)
+
+    # Resend alerts whose anchors were saved but which never reached Telegram
+    for notif in monitor.open_outbox():
+        notification_queue.submit(notif)
     
     try:
-        last_check_time = datetime.now()
+        scheduler = PollScheduler(POLL_TIERS)
         last_sync_time = datetime.now()
+        last_flush_time = datetime.now()
+        last_resubmit_time = datetime.now()
         
         while True:
+            due_tiers = scheduler.wait()
             current_time = datetime.now()
             
             # Sync tokens to watchlist every 10 seconds
             if (current_time - last_sync_time).total_seconds() >= 10:
-                # Get the current tokens directly from the file, not from memory
-                current_tokens = {}
-                if os.path.exists('tokens.json') and os.path.getsize('tokens.json') > 0:
-                    try:
-                        with open('tokens.json', 'r') as f:
-                            current_tokens = {int(k): v for k, v in json.load(f).items()}
-                        logger.info(f"Syncing with {len(current_tokens)} tokens from tokens.json")
-                    except Exception as e:
-                        logger.error(f"Error loading tokens during sync: {e}")
-                
-                # Then load the watchlist
-                watchlist = monitor.load_watchlist()
-                tokens_added = False
+                # Get the current tokens directly from storage, since the bot may run as a separate process
+                current_tokens = None
+                try:
+                    current_tokens = monitor.storage.load_tokens()
+                    logger.info(f"Syncing with {len(current_tokens)} tokens from storage")
+                except Exception as e:
+                    logger.error(f"Error loading tokens during sync: {e}")
                 
-                # Only add tokens that exist in the tokens.json file
-                for token_id in current_tokens.keys():
-                    if token_id not in watchlist:
-                        # Add token to watchlist with null prices
-                        watchlist[token_id] = {
-                            "short_term": {
-                                "last_price": None,
-                                "last_notification_time": current_time
-                            },
-                            "long_term": {
-                                "last_price": None,
-                                "last_notification_time": current_time
-                            },
-                            "name": current_tokens[token_id]["name"],
-                            "symbol": current_tokens[token_id]["symbol"]
-                        }
-                        logger.info(f"Added {current_tokens[token_id]['symbol']} to watchlist with null prices")
-                        tokens_added = True
-                
-                if tokens_added:
-                    monitor.save_watchlist(watchlist)
-                
-                # Update the monitor's tokens to match what's in the file
-                monitor.tokens = current_tokens
+                if current_tokens is not None:
+                    watchlist = monitor.watchlist
+                    
+                    # Only add tokens that exist in storage
+                    for token_id in current_tokens.keys():
+                        if token_id not in watchlist:
+                            # Add token to watchlist with null prices
+                            watchlist[token_id] = {
+                                "short_term": {
+                                    "last_price": None,
+                                    "last_notification_time": current_time
+                                },
+                                "long_term": {
+                                    "last_price": None,
+                                    "last_notification_time": current_time
+                                },
+                                "name": current_tokens[token_id]["name"],
+                                "symbol": current_tokens[token_id]["symbol"]
+                            }
+                            monitor._dirty_coins.add(token_id)
+                            monitor.watchlist_version += 1
+                            logger.info(f"Added {current_tokens[token_id]['symbol']} to watchlist with null prices")
+                    
+                    # Drop coins that were removed through the bot
+                    for coin_id in [c for c in watchlist if c not in current_tokens]:
+                        del watchlist[coin_id]
+                        monitor._dirty_coins.add(coin_id)
+                        monitor.watchlist_version += 1
+                        logger.info(f"Removed coin ID {coin_id} from watchlist, no longer in tokens")
+                    
+                    # Update the monitor's tokens to match what's in storage
+                    monitor.tokens = current_tokens
                 
                 last_sync_time = current_time
             
-            if (current_time - last_check_time).total_seconds() >= PRICE_CHECK_INTERVAL:
-                # Always call check_price_movements to ensure tokens are added to watchlist
-                notifications = monitor.check_price_movements()
+            # Write pending anchor changes behind the in-memory watchlist
+            if (current_time - last_flush_time).total_seconds() >= WATCHLIST_FLUSH_INTERVAL:
+                monitor.flush()
+                last_flush_time = current_time
+            
+            # Give alerts the notifier gave up on, or left in the outbox when it overflowed, another run
+            if (current_time - last_resubmit_time).total_seconds() >= OUTBOX_RESUBMIT_INTERVAL:
+                resubmitted = notification_queue.submit_pending(monitor.unsent_notifications(digest.pending))
+                if resubmitted:
+                    logger.info(f"Re-submitted {resubmitted} unsent notifications from the outbox")
+                last_resubmit_time = current_time
+            
+            coin_ids = monitor.coins_due(due_tiers)
+            if coin_ids or DEFAULT_POLL_TIER in due_tiers:
+                notifications = monitor.check_price_movements(coin_ids)
                 
-                if notifications:
-                    for notif in notifications:
-                        # Different message format based on notification type
-                        if notif["type"] == "absolute":
-                            # Absolute change notification without time
-                            direction = "up" if notif["price_change"] > 0 else "down"
-                            message = (
-                                f"{notif['coin_name']} ({notif['coin_symbol']}) {direction} by {abs(notif['price_change']):.2f}%\n"
-                                f"Current price: ${notif['current_price']:.4f}"
-                            )
-                        else:
-                            # Short-term or long-term notification with time
-                            hours = notif["time_elapsed"].total_seconds() / 3600
-                            time_str = (
-                                f"{int(hours)} hours" if hours >= 1
-                                else f"{int(notif['time_elapsed'].total_seconds() / 60)} minutes"
-                            )
-                            
-                            direction = "up" if notif["price_change"] > 0 else "down"
-                            
-                            message = (
-                                f"{notif['coin_name']} ({notif['coin_symbol']}) {direction} by {abs(notif['price_change']):.2f}% in {time_str}\n"
-                                f"Current price: ${notif['current_price']:.4f}"
-                            )
-                        
-                        # Only print to console, no need to duplicate the logging
-                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
-                        
-                        # Send to Telegram
-                        monitor.send_telegram_notification(message)
-                elif len(monitor.load_watchlist()) == 0:
+                for notif in digest.add(notifications):
+                    notification_queue.submit(notif)
+                if not notifications and len(monitor.watchlist) == 0:
                     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] No coins in watchlist")
-                
-                last_check_time = current_time
-            
-            time.sleep(1)
+
+            if digest.ready():
+                for message in digest.take():
+                    notification_queue.submit(message)
             
     except KeyboardInterrupt:
         print("\nStopping price monitor...")
+    finally:
+        for message in digest.take():
+            notification_queue.submit(message)
+        notification_queue.close()
+        monitor.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,96 @@
+import numpy as np
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+# Elapsed times are compared as integer microseconds, the resolution of timedelta
+NO_TIME_LIMIT = np.iinfo(np.int64).max
+
+class CompiledThresholds:
+    """A threshold table compiled once into sorted, immutable elapsed-time breakpoints.
+
+    A rule fires when |change| >= percent and elapsed <= minutes for any threshold, which is the
+    same as |change| reaching the smallest percent among thresholds whose window still covers
+    the elapsed time. That percent is precomputed per breakpoint, so a lookup is one bisect.
+    """
+
+    def __init__(self, thresholds: List[Dict]):
+        ordered = sorted(
+            (
+                NO_TIME_LIMIT if t["minutes"] == float('inf') else timedelta(minutes=t["minutes"]) // timedelta(microseconds=1),
+                float(t["percent"])
+            )
+            for t in thresholds
+        )
+
+        # Suffix minimum: the easiest threshold still reachable at or beyond each breakpoint
+        required = []
+        lowest = float('inf')
+        for _, percent in reversed(ordered):
+            lowest = min(lowest, percent)
+            required.append(lowest)
+        required.reverse()
+
+        self.limits = tuple(limit for limit, _ in ordered)
+        # Past the last breakpoint no threshold can fire
+        self.required = tuple(required) + (float('inf'),)
+
+        self._limits_array = np.array(self.limits, dtype=np.int64)
+        self._required_array = np.array(self.required, dtype=np.float64)
+        self._limits_array.flags.writeable = False
+        self._required_array.flags.writeable = False
+
+    def required_percent(self, elapsed_us: int) -> float:
+        """Smallest absolute move that fires after elapsed_us microseconds"""
+        return self.required[bisect_left(self.limits, elapsed_us)]
+
+    def required_percents(self, elapsed_us: np.ndarray) -> np.ndarray:
+        """Vectorized required_percent"""
+        return self._required_array[np.searchsorted(self._limits_array, elapsed_us, side='left')]
+
+    def match(self, change: np.ndarray, elapsed_us: np.ndarray) -> np.ndarray:
+        """True for every coin where any threshold fires"""
+        return np.abs(change) >= self.required_percents(elapsed_us)
+
+def percent_change(current: np.ndarray, anchor: np.ndarray) -> np.ndarray:
+    """Percent move from each anchor price to the current price"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return ((current - anchor) / anchor) * 100
+
+def elapsed_microseconds(current_time: datetime, anchor_times: np.ndarray) -> np.ndarray:
+    """Microseconds from each anchor time to current_time"""
+    return (np.datetime64(current_time, 'us') - anchor_times).astype(np.int64)
+
+class PriceColumns:
+    """Columnar view of the coins being evaluated in one cycle"""
+
+    def __init__(self, coin_ids: List[int], current: List[float], short_term_price: List[float],
+                 short_term_time: List[datetime], long_term_price: List[float], long_term_time: List[datetime]):
+        self.coin_ids = coin_ids
+        self.current = np.array(current, dtype=np.float64)
+        self.short_term_price = np.array(short_term_price, dtype=np.float64)
+        self.short_term_time = np.array(short_term_time, dtype='datetime64[us]')
+        self.long_term_price = np.array(long_term_price, dtype=np.float64)
+        self.long_term_time = np.array(long_term_time, dtype='datetime64[us]')
+
+    def __len__(self):
+        return len(self.coin_ids)
+
+def evaluate(columns: PriceColumns, current_time: datetime, short_term_rules: CompiledThresholds,
+             long_term_rules: CompiledThresholds, absolute_percent: float) -> Dict[str, np.ndarray]:
+    """Evaluate every rule for every coin in one pass"""
+    short_term_change = percent_change(columns.current, columns.short_term_price)
+    long_term_change = percent_change(columns.current, columns.long_term_price)
+    short_term_elapsed = elapsed_microseconds(current_time, columns.short_term_time)
+    long_term_elapsed = elapsed_microseconds(current_time, columns.long_term_time)
+
+    return {
+        "short_term_change": short_term_change,
+        "long_term_change": long_term_change,
+        "short_term_elapsed": short_term_elapsed,
+        "long_term_elapsed": long_term_elapsed,
+        "valid": np.isfinite(short_term_change) & np.isfinite(long_term_change),
+        "short_term": short_term_rules.match(short_term_change, short_term_elapsed),
+        "long_term": long_term_rules.match(long_term_change, long_term_elapsed),
+        "absolute": np.abs(short_term_change) >= absolute_percent
+    }
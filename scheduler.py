@@ -0,0 +1,74 @@
+import math
+import time
+import asyncio
+import logging
+from functools import reduce
+from typing import Dict, Set
+
+logger = logging.getLogger(__name__)
+
+class PollScheduler:
+    """Fires on monotonic-clock deadlines aligned to wall-clock multiples of the tick.
+
+    The tick is the greatest common divisor of the tier intervals, so with tiers of 15s, 60s
+    and 300s it fires every 15 seconds and each tier is due on its own wall-clock boundary
+    (the 60s tier on the minute, the 300s tier every five minutes). Deadlines advance by
+    exactly one tick, so time spent fetching and sending never accumulates as drift. When a
+    tick runs past the next deadline the overrun is reported, whole missed ticks are skipped,
+    and the tiers that were due during them are carried into the next tick.
+    """
+
+    def __init__(self, tier_intervals: Dict[str, int], clock=time.monotonic, wall_clock=time.time):
+        self.tier_intervals = dict(tier_intervals)
+        self.tick = reduce(math.gcd, (int(interval) for interval in self.tier_intervals.values()))
+        self.clock = clock
+        self.wall_clock = wall_clock
+
+        # Align the first deadline to the next wall-clock multiple of the tick
+        wall_now = self.wall_clock()
+        next_boundary = math.floor(wall_now / self.tick) * self.tick + self.tick
+        self.tick_number = int(next_boundary // self.tick)
+        self.deadline = self.clock() + (next_boundary - wall_now)
+
+        self._carried = set()
+        self.stats = {"ticks": 0, "overruns": 0, "missed_ticks": 0, "max_overrun_seconds": 0.0}
+
+    def _due_at(self, tick_number: int) -> Set[str]:
+        seconds = tick_number * self.tick
+        return {tier for tier, interval in self.tier_intervals.items() if seconds % interval == 0}
+
+    def _prepare(self) -> float:
+        """Account for any overrun and return how long to sleep until the next deadline"""
+        now = self.clock()
+        if now > self.deadline:
+            late = now - self.deadline
+            missed = int(late // self.tick)
+            self.stats["overruns"] += 1
+            self.stats["max_overrun_seconds"] = max(self.stats["max_overrun_seconds"], late)
+            if missed:
+                # Skip whole ticks but keep the tiers that were due during them
+                for tick_number in range(self.tick_number, self.tick_number + missed):
+                    self._carried |= self._due_at(tick_number)
+                self.tick_number += missed
+                self.deadline += missed * self.tick
+                self.stats["missed_ticks"] += missed
+            logger.warning(f"⚠️🟡 SCHEDULER OVERRUN 🟡⚠️ Previous cycle ran {late:.2f}s past its deadline, skipped {missed} tick{'s' if missed != 1 else ''}")
+        return max(0.0, self.deadline - self.clock())
+
+    def _fire(self) -> Set[str]:
+        due = self._due_at(self.tick_number) | self._carried
+        self._carried = set()
+        self.tick_number += 1
+        self.deadline += self.tick
+        self.stats["ticks"] += 1
+        return due
+
+    def wait(self) -> Set[str]:
+        """Block until the next deadline and return the tiers due at it"""
+        time.sleep(self._prepare())
+        return self._fire()
+
+    async def wait_async(self) -> Set[str]:
+        """Sleep on the event loop until the next deadline and return the tiers due at it"""
+        await asyncio.sleep(self._prepare())
+        return self._fire()
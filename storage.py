@@ -0,0 +1,679 @@
+import os
+import json
+import math
+import mmap
+import struct
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List
+from filelock import FileLock
+
+logger = logging.getLogger(__name__)
+
+WATCHLIST_FILE = "watchlist.json"
+TOKENS_FILE = "tokens.json"
+SQLITE_FILE = "monitor.db"
+JOURNAL_FILE = "watchlist.journal"
+BINARY_FILE = "watchlist.bin"
+JOURNAL_COMPACT_RECORDS = 5000
+
+def parse_watchlist_entry(info: Dict) -> Dict:
+    """Convert a serialized watchlist entry into the in-memory form used by PriceMonitor"""
+    return {
+        "short_term": {
+            "last_price": info["short_term"]["last_price"],
+            "last_notification_time": datetime.fromisoformat(info["short_term"]["last_notification_time"])
+        },
+        "long_term": {
+            "last_price": info["long_term"]["last_price"],
+            "last_notification_time": datetime.fromisoformat(info["long_term"]["last_notification_time"])
+        },
+        "name": info["name"],
+        "symbol": info["symbol"]
+    }
+
+def serialize_watchlist_entry(info: Dict) -> Dict:
+    """Convert an in-memory watchlist entry into its JSON-ready form"""
+    return {
+        "symbol": info["symbol"],
+        "name": info["name"],
+        "short_term": {
+            "last_price": info["short_term"]["last_price"],
+            "last_notification_time": info["short_term"]["last_notification_time"].isoformat()
+        },
+        "long_term": {
+            "last_price": info["long_term"]["last_price"],
+            "last_notification_time": info["long_term"]["last_notification_time"].isoformat()
+        }
+    }
+
+class JsonStorage:
+    """Whole-file JSON persistence for tokens.json and watchlist.json"""
+
+    def __init__(self, watchlist_file: str = WATCHLIST_FILE, tokens_file: str = TOKENS_FILE):
+        self.watchlist_file = watchlist_file
+        self.tokens_file = tokens_file
+        self.lock_file = f"{watchlist_file}.lock"
+
+        # Initialize watchlist.json if it doesn't exist
+        if not os.path.exists(self.watchlist_file) or os.path.getsize(self.watchlist_file) == 0:
+            with open(self.watchlist_file, 'w') as f:
+                json.dump({}, f, indent=2)
+            logger.info(f"Created empty {self.watchlist_file} file")
+
+    def load_tokens(self) -> Dict[int, Dict]:
+        if not os.path.exists(self.tokens_file):
+            logger.info(f"No {self.tokens_file} found, starting with empty token list")
+            with open(self.tokens_file, 'w') as f:
+                json.dump({}, f, indent=2)
+            return {}
+        with open(self.tokens_file, 'r') as f:
+            tokens = {int(k): v for k, v in json.load(f).items()}
+        logger.info(f"Loaded {len(tokens)} tokens from {self.tokens_file}")
+        return tokens
+
+    def load_watchlist(self) -> Dict[int, Dict]:
+        try:
+            if os.path.exists(self.watchlist_file) and os.path.getsize(self.watchlist_file) > 0:
+                with open(self.watchlist_file, "r") as f:
+                    data = json.load(f)
+
+                    # Start with an empty watchlist
+                    watchlist = {}
+
+                    # Process each coin in the data
+                    for coin_id_str, info in data.items():
+                        try:
+                            coin_id = int(coin_id_str)
+
+                            # Validate required fields
+                            if not all(k in info for k in ["short_term", "long_term", "name", "symbol"]):
+                                logger.warning(f"Skipping coin {coin_id_str} due to missing required fields")
+                                continue
+
+                            watchlist[coin_id] = parse_watchlist_entry(info)
+                        except Exception as e:
+                            logger.error(f"Error processing coin {coin_id_str} in watchlist: {e}")
+                            # Skip this coin but continue processing others
+                            continue
+
+                logger.info(f"Loaded watchlist with {len(watchlist)} coins")
+                return watchlist
+            else:
+                logger.info("No existing watchlist found or file is empty")
+                return {}
+        except FileNotFoundError:
+            logger.info("No existing watchlist found, using empty watchlist")
+            return {}
+        except json.JSONDecodeError:
+            logger.error("Watchlist file exists but is not valid JSON, using empty watchlist")
+            return {}
+        except Exception as e:
+            logger.error(f"Error loading watchlist: {e}")
+            return {}
+
+    def _merge_file(self, path: str, changes: Dict, **dump_kwargs):
+        # Merge into the file so entries written by another process are kept
+        data = {}
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            except json.JSONDecodeError:
+                logger.error(f"{path} is not valid JSON, rewriting it from memory")
+        for key, value in changes.items():
+            if value is None:
+                data.pop(str(key), None)
+            else:
+                data[str(key)] = value
+        with open(path, "w") as f:
+            json.dump(data, f, **dump_kwargs)
+        return len(data)
+
+    def write_changes(self, coins: Dict[int, Dict], tokens: Dict[int, Dict], notifications: List[Dict] = None):
+        """Apply changed entries (None means removed). JSON storage keeps no notification history"""
+        # Use file locking to prevent conflicts
+        with FileLock(self.lock_file):
+            if coins:
+                self._merge_file(self.watchlist_file, coins, indent=2, sort_keys=True)
+                logger.info(f"Flushed {len(coins)} watchlist entries to {self.watchlist_file}")
+            if tokens:
+                total = self._merge_file(self.tokens_file, tokens, indent=2)
+                logger.info(f"Saved {total} tokens to {self.tokens_file}")
+
+    def close(self):
+        pass
+
+class SqliteStorage:
+    """SQLite persistence in WAL mode with one row per token, per watched coin and per sent notification"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tokens (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            symbol TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS watchlist (
+            coin_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            short_term_price REAL,
+            short_term_time TEXT NOT NULL,
+            long_term_price REAL,
+            long_term_time TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            coin_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            price_change REAL NOT NULL,
+            current_price REAL NOT NULL,
+            created_at TEXT NOT NULL,
+            sent_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS notifications_coin_time ON notifications (coin_id, created_at);
+    """
+    # PRAGMA user_version once the JSON files have been imported
+    MIGRATED_VERSION = 1
+
+    def __init__(self, path: str = SQLITE_FILE, import_json: bool = True):
+        self.path = path
+        self._lock = threading.Lock()
+        # Writes come from the write-behind worker thread as well as the main thread
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        # Databases created before sent notifications were recorded lack the column
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(notifications)")}
+        if "sent_at" not in columns:
+            self.conn.execute("ALTER TABLE notifications ADD COLUMN sent_at TEXT")
+        self.conn.commit()
+
+        if import_json:
+            self.import_json_files()
+
+    def import_json_files(self, watchlist_file: str = WATCHLIST_FILE, tokens_file: str = TOKENS_FILE):
+        """One-off migration of the JSON files, recorded in user_version so it never runs twice"""
+        with self._lock:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            has_rows = self.conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM tokens) OR EXISTS (SELECT 1 FROM watchlist)"
+            ).fetchone()[0]
+        if version >= self.MIGRATED_VERSION:
+            return
+        # A database filled before the marker existed was migrated already
+        if has_rows or not (os.path.exists(watchlist_file) or os.path.exists(tokens_file)):
+            self._mark_migrated()
+            return
+
+        json_storage = JsonStorage(watchlist_file, tokens_file)
+
+        try:
+            tokens = json_storage.load_tokens()
+            watchlist = json_storage.load_watchlist()
+        except Exception as e:
+            logger.error(f"Error reading JSON files for migration: {e}")
+            return
+
+        coins = {coin_id: serialize_watchlist_entry(info) for coin_id, info in watchlist.items()}
+        self.write_changes(coins, tokens)
+        self._mark_migrated()
+        logger.info(f"Migrated {len(tokens)} tokens and {len(coins)} watchlist coins from JSON into {self.path}")
+
+    def _mark_migrated(self):
+        with self._lock:
+            self.conn.execute(f"PRAGMA user_version = {self.MIGRATED_VERSION}")
+            self.conn.commit()
+
+    def load_tokens(self) -> Dict[int, Dict]:
+        with self._lock:
+            rows = self.conn.execute("SELECT id, name, symbol FROM tokens").fetchall()
+        tokens = {row[0]: {"name": row[1], "symbol": row[2]} for row in rows}
+        logger.info(f"Loaded {len(tokens)} tokens from {self.path}")
+        return tokens
+
+    def load_watchlist(self) -> Dict[int, Dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT coin_id, name, symbol, short_term_price, short_term_time, long_term_price, long_term_time FROM watchlist"
+            ).fetchall()
+
+        watchlist = {}
+        for coin_id, name, symbol, st_price, st_time, lt_price, lt_time in rows:
+            try:
+                watchlist[coin_id] = {
+                    "short_term": {
+                        "last_price": st_price,
+                        "last_notification_time": datetime.fromisoformat(st_time)
+                    },
+                    "long_term": {
+                        "last_price": lt_price,
+                        "last_notification_time": datetime.fromisoformat(lt_time)
+                    },
+                    "name": name,
+                    "symbol": symbol
+                }
+            except Exception as e:
+                logger.error(f"Error processing coin {coin_id} in watchlist: {e}")
+        logger.info(f"Loaded watchlist with {len(watchlist)} coins from {self.path}")
+        return watchlist
+
+    def write_changes(self, coins: Dict[int, Dict], tokens: Dict[int, Dict], notifications: List[Dict] = None):
+        """Apply changed entries (None means removed) as single-row upserts in one transaction"""
+        coin_rows = [
+            (coin_id, e["name"], e["symbol"],
+             e["short_term"]["last_price"], e["short_term"]["last_notification_time"],
+             e["long_term"]["last_price"], e["long_term"]["last_notification_time"])
+            for coin_id, e in coins.items() if e is not None
+        ]
+        removed_coins = [(coin_id,) for coin_id, e in coins.items() if e is None]
+        token_rows = [(token_id, t["name"], t["symbol"]) for token_id, t in (tokens or {}).items() if t is not None]
+        removed_tokens = [(token_id,) for token_id, t in (tokens or {}).items() if t is None]
+        notification_rows = [
+            (n["coin_id"], n["type"], n["price_change"], n["current_price"], n["created_at"], n["sent_at"])
+            for n in (notifications or [])
+        ]
+
+        with self._lock, self.conn:
+            self.conn.executemany(
+                """INSERT INTO watchlist (coin_id, name, symbol, short_term_price, short_term_time, long_term_price, long_term_time)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (coin_id) DO UPDATE SET
+                       name = excluded.name,
+                       symbol = excluded.symbol,
+                       short_term_price = excluded.short_term_price,
+                       short_term_time = excluded.short_term_time,
+                       long_term_price = excluded.long_term_price,
+                       long_term_time = excluded.long_term_time""",
+                coin_rows
+            )
+            self.conn.executemany("DELETE FROM watchlist WHERE coin_id = ?", removed_coins)
+            self.conn.executemany(
+                """INSERT INTO tokens (id, name, symbol) VALUES (?, ?, ?)
+                   ON CONFLICT (id) DO UPDATE SET name = excluded.name, symbol = excluded.symbol""",
+                token_rows
+            )
+            self.conn.executemany("DELETE FROM tokens WHERE id = ?", removed_tokens)
+            self.conn.executemany(
+                "INSERT INTO notifications (coin_id, type, price_change, current_price, created_at, sent_at) VALUES (?, ?, ?, ?, ?, ?)",
+                notification_rows
+            )
+
+        if coin_rows or removed_coins or token_rows or removed_tokens:
+            logger.info(
+                f"Flushed {len(coin_rows) + len(removed_coins)} watchlist rows, "
+                f"{len(token_rows) + len(removed_tokens)} token rows and {len(notification_rows)} notifications to {self.path}"
+            )
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+class JournalStorage(JsonStorage):
+    """JSON snapshot files plus an append-only journal of the changes made since the snapshot.
+
+    Each flush appends one compact record per changed anchor, so write cost follows the number
+    of changes rather than the watchlist size. The snapshot is rewritten every compact_after
+    records and on close. Every read and append holds the lock file and first applies what
+    other processes appended, so the bot and the standalone monitor can share the files.
+    """
+
+    def __init__(self, watchlist_file: str = WATCHLIST_FILE, tokens_file: str = TOKENS_FILE,
+                 journal_file: str = JOURNAL_FILE, compact_after: int = JOURNAL_COMPACT_RECORDS):
+        super().__init__(watchlist_file, tokens_file)
+        self.journal_file = journal_file
+        self.compact_after = compact_after
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(self.lock_file)
+        self._journal = None
+
+        with self._file_lock:
+            self._reload()
+
+    def _read_json(self, path: str) -> Dict[str, Dict]:
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return {}
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            logger.error(f"{path} is not valid JSON, replaying the journal onto an empty snapshot")
+            return {}
+
+    def _reload(self):
+        """Rebuild the serialized replica of what is on disk from the snapshot and the whole journal"""
+        self._coins = self._read_json(self.watchlist_file)
+        self._tokens = self._read_json(self.tokens_file)
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_file, "a")
+        self._journal_inode = os.fstat(self._journal.fileno()).st_ino
+        self._offset = 0
+        self._journal_records = 0
+        replayed = self._read_journal()
+        if replayed:
+            logger.info(f"Replayed {replayed} journal records from {self.journal_file}")
+
+    def _read_journal(self) -> int:
+        """Apply the records appended since the last read"""
+        with open(self.journal_file, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        replayed = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("record has no line end")
+                self._apply(json.loads(line))
+                replayed += 1
+            except (ValueError, KeyError) as e:
+                # A torn line from a crash mid-append, everything before it is intact
+                logger.warning(f"Skipping unreadable journal record in {self.journal_file}: {e}")
+        if data and not data.endswith(b"\n"):
+            # End the torn line so the next append starts a record of its own
+            self._journal.write("\n")
+            self._journal.flush()
+        self._offset = os.fstat(self._journal.fileno()).st_size
+        self._journal_records += replayed
+        return replayed
+
+    def _catch_up(self):
+        """Apply other processes' appends, or reload after one of them compacted. Needs the file lock"""
+        try:
+            inode = os.stat(self.journal_file).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self._journal_inode:
+            self._reload()
+        else:
+            self._read_journal()
+
+    def _apply(self, record: Dict):
+        op = record["op"]
+        key = str(record["id"])
+        if op == "anchor":
+            self._coins[key][record["h"]] = {"last_price": record["p"], "last_notification_time": record["t"]}
+        elif op == "set":
+            self._coins[key] = record["entry"]
+        elif op == "del":
+            self._coins.pop(key, None)
+        elif op == "token":
+            self._tokens[key] = record["token"]
+        elif op == "untoken":
+            self._tokens.pop(key, None)
+
+    def _diff(self, coins: Dict[int, Dict], tokens: Dict[int, Dict]) -> List[Dict]:
+        """Turn changed entries into the smallest set of journal records"""
+        records = []
+        for coin_id, entry in coins.items():
+            old = self._coins.get(str(coin_id))
+            if entry is None:
+                if old is not None:
+                    records.append({"op": "del", "id": coin_id})
+            elif old is None or old["name"] != entry["name"] or old["symbol"] != entry["symbol"]:
+                records.append({"op": "set", "id": coin_id, "entry": entry})
+            else:
+                for horizon in ("short_term", "long_term"):
+                    if old[horizon] != entry[horizon]:
+                        records.append({
+                            "op": "anchor",
+                            "id": coin_id,
+                            "h": horizon,
+                            "p": entry[horizon]["last_price"],
+                            "t": entry[horizon]["last_notification_time"]
+                        })
+        for token_id, token in tokens.items():
+            if token is None:
+                records.append({"op": "untoken", "id": token_id})
+            elif self._tokens.get(str(token_id)) != token:
+                records.append({"op": "token", "id": token_id, "token": token})
+        return records
+
+    def load_tokens(self) -> Dict[int, Dict]:
+        with self._lock, self._file_lock:
+            self._catch_up()
+            tokens = {int(k): dict(v) for k, v in self._tokens.items()}
+        logger.info(f"Loaded {len(tokens)} tokens from {self.tokens_file} and {self.journal_file}")
+        return tokens
+
+    def load_watchlist(self) -> Dict[int, Dict]:
+        watchlist = {}
+        with self._lock, self._file_lock:
+            self._catch_up()
+            for coin_id_str, info in self._coins.items():
+                try:
+                    watchlist[int(coin_id_str)] = parse_watchlist_entry(info)
+                except Exception as e:
+                    logger.error(f"Error processing coin {coin_id_str} in watchlist: {e}")
+        logger.info(f"Loaded watchlist with {len(watchlist)} coins from {self.watchlist_file} and {self.journal_file}")
+        return watchlist
+
+    def write_changes(self, coins: Dict[int, Dict], tokens: Dict[int, Dict], notifications: List[Dict] = None):
+        """Append one compact record per change and fsync once for the whole batch"""
+        with self._lock, self._file_lock:
+            self._catch_up()
+            records = self._diff(coins, tokens or {})
+            if not records:
+                return
+            self._journal.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records))
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            for record in records:
+                self._apply(record)
+            self._offset = os.fstat(self._journal.fileno()).st_size
+            self._journal_records += len(records)
+            logger.info(f"Appended {len(records)} records to {self.journal_file}")
+
+            if self._journal_records >= self.compact_after:
+                self._compact()
+
+    def _compact(self):
+        """Write the replica as a fresh snapshot and start an empty journal"""
+        for path, data, dump_kwargs in (
+            (self.watchlist_file, self._coins, {"indent": 2, "sort_keys": True}),
+            (self.tokens_file, self._tokens, {"indent": 2})
+        ):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, **dump_kwargs)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+        # Only drop the journal once both snapshot files are safely in place. A new file rather
+        # than a truncation, so other processes notice the compaction by its inode
+        tmp_path = f"{self.journal_file}.tmp"
+        open(tmp_path, "w").close()
+        os.replace(tmp_path, self.journal_file)
+        self._journal.close()
+        self._journal = open(self.journal_file, "a")
+        self._journal_inode = os.fstat(self._journal.fileno()).st_ino
+        logger.info(f"Compacted {self._journal_records} journal records into {self.watchlist_file}")
+        self._offset = 0
+        self._journal_records = 0
+
+    def compact(self):
+        with self._lock, self._file_lock:
+            self._catch_up()
+            self._compact()
+
+    def close(self):
+        with self._lock, self._file_lock:
+            self._catch_up()
+            if self._journal_records:
+                self._compact()
+            self._journal.close()
+
+class BinaryStorage:
+    """Fixed-width binary records for the per-coin anchors, memory-mapped and updated in place.
+
+    Each slot holds a coin id, both anchor prices (NaN when not yet initialised) and both anchor
+    times as epoch seconds; a zero id marks a free slot. Names and symbols are variable width
+    and stay in tokens.json. The header counts layout generations: every slot allocation, free
+    and growth bumps it. Reads and writes hold a lock file and re-index only when the generation
+    moved, so processes sharing the file never hand out the same free slot while an anchor
+    update stays a write at a known offset.
+    """
+
+    HEADER = struct.Struct("<4sHHQ")
+    RECORD = struct.Struct("<qdddd")
+    MAGIC = b"PMWL"
+    VERSION = 1
+
+    def __init__(self, path: str = BINARY_FILE, watchlist_file: str = WATCHLIST_FILE,
+                 tokens_file: str = TOKENS_FILE, initial_capacity: int = 64):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(f"{path}.lock")
+        # Tokens keep using the JSON file, which is also the migration source for the anchors
+        self._json = JsonStorage(watchlist_file, tokens_file)
+
+        with self._file_lock:
+            is_new = not os.path.exists(path) or os.path.getsize(path) < self.HEADER.size
+            if is_new:
+                with open(path, "wb") as f:
+                    f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.RECORD.size, 0))
+                    f.write(bytes(self.RECORD.size * initial_capacity))
+
+            self._file = open(path, "r+b")
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+            magic, version, record_size, _ = self.HEADER.unpack_from(self._mm, 0)
+            if magic != self.MAGIC or version != self.VERSION or record_size != self.RECORD.size:
+                raise ValueError(f"{path} is not a version {self.VERSION} watchlist state file")
+            self._reindex()
+
+            if is_new:
+                watchlist = self._json.load_watchlist()
+                if watchlist:
+                    self._write_slots({coin_id: serialize_watchlist_entry(info) for coin_id, info in watchlist.items()})
+                    logger.info(f"Migrated {len(watchlist)} watchlist coins from {watchlist_file} into {path}")
+
+    def _capacity(self) -> int:
+        return (len(self._mm) - self.HEADER.size) // self.RECORD.size
+
+    def _refresh(self):
+        """Re-index when another process changed the slot layout since the last look. Needs the file lock"""
+        if self.HEADER.unpack_from(self._mm, 0)[3] != self._generation:
+            self._reindex()
+
+    def _reindex(self):
+        """Index the occupied slots by coin id and remember the free ones for reuse. Needs the file lock"""
+        # Another process may have grown the file since it was mapped
+        if os.fstat(self._file.fileno()).st_size != len(self._mm):
+            self._mm.close()
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+        self._generation = self.HEADER.unpack_from(self._mm, 0)[3]
+        self._slots = {}
+        self._free = []
+        for slot, record in enumerate(struct.iter_unpack(self.RECORD.format, self._mm[self.HEADER.size:])):
+            if record[0]:
+                self._slots[record[0]] = slot
+            else:
+                self._free.append(slot)
+        self._free.reverse()
+
+    def _grow(self):
+        """Double the number of slots and remap the file"""
+        old_capacity = self._capacity()
+        new_capacity = max(old_capacity * 2, 64)
+        self._mm.flush()
+        self._mm.close()
+        self._file.truncate(self.HEADER.size + new_capacity * self.RECORD.size)
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        self._free.extend(range(new_capacity - 1, old_capacity - 1, -1))
+
+    def load_tokens(self) -> Dict[int, Dict]:
+        return self._json.load_tokens()
+
+    def load_watchlist(self) -> Dict[int, Dict]:
+        tokens = self._json.load_tokens()
+        watchlist = {}
+        with self._lock, self._file_lock:
+            self._refresh()
+            for coin_id, slot in self._slots.items():
+                _, st_price, st_time, lt_price, lt_time = self.RECORD.unpack_from(
+                    self._mm, self.HEADER.size + slot * self.RECORD.size
+                )
+                token = tokens.get(coin_id, {})
+                watchlist[coin_id] = {
+                    "short_term": {
+                        "last_price": None if math.isnan(st_price) else st_price,
+                        "last_notification_time": datetime.fromtimestamp(st_time)
+                    },
+                    "long_term": {
+                        "last_price": None if math.isnan(lt_price) else lt_price,
+                        "last_notification_time": datetime.fromtimestamp(lt_time)
+                    },
+                    "name": token.get("name", "Unknown"),
+                    "symbol": token.get("symbol", "Unknown")
+                }
+        logger.info(f"Loaded watchlist with {len(watchlist)} coins from {self.path}")
+        return watchlist
+
+    def write_changes(self, coins: Dict[int, Dict], tokens: Dict[int, Dict], notifications: List[Dict] = None):
+        """Rewrite only the slots of changed coins, then flush the mapping once"""
+        if tokens:
+            self._json.write_changes({}, tokens)
+        if not coins:
+            return
+
+        with self._lock, self._file_lock:
+            self._refresh()
+            self._write_slots(coins)
+        logger.info(f"Flushed {len(coins)} watchlist records to {self.path}")
+
+    def _write_slots(self, coins: Dict[int, Dict]):
+        """Write the changed slots and flush the mapping once. Needs the file lock"""
+        layout_changed = False
+        for coin_id, entry in coins.items():
+            slot = self._slots.get(coin_id)
+            if entry is None:
+                if slot is not None:
+                    self.RECORD.pack_into(self._mm, self.HEADER.size + slot * self.RECORD.size, 0, 0.0, 0.0, 0.0, 0.0)
+                    del self._slots[coin_id]
+                    self._free.append(slot)
+                    layout_changed = True
+                continue
+
+            if slot is None:
+                if not self._free:
+                    self._grow()
+                slot = self._free.pop()
+                self._slots[coin_id] = slot
+                layout_changed = True
+
+            st, lt = entry["short_term"], entry["long_term"]
+            self.RECORD.pack_into(
+                self._mm, self.HEADER.size + slot * self.RECORD.size,
+                coin_id,
+                math.nan if st["last_price"] is None else st["last_price"],
+                datetime.fromisoformat(st["last_notification_time"]).timestamp(),
+                math.nan if lt["last_price"] is None else lt["last_price"],
+                datetime.fromisoformat(lt["last_notification_time"]).timestamp()
+            )
+        if layout_changed:
+            # Tells the other processes to re-index before their next read or write
+            self._generation += 1
+            self.HEADER.pack_into(self._mm, 0, self.MAGIC, self.VERSION, self.RECORD.size, self._generation)
+        self._mm.flush()
+
+    def close(self):
+        with self._lock:
+            self._mm.flush()
+            self._mm.close()
+            self._file.close()
+
+def create_storage(backend: str):
+    """Build the storage backend named by STORAGE_BACKEND"""
+    if backend == "sqlite":
+        return SqliteStorage()
+    if backend == "journal":
+        return JournalStorage()
+    if backend == "binary":
+        return BinaryStorage()
+    if backend != "json":
+        logger.warning(f"Unknown storage backend '{backend}', falling back to json")
+    return JsonStorage()
@@ -1,11 +1,12 @@
 import os
+import asyncio
 import logging
 import signal
 import sys
 import time
 import threading
-from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from telegram.error import TelegramError, NetworkError, TimedOut
 from dotenv import load_dotenv
 from price_monitor import PriceMonitor, SHORT_TERM_THRESHOLDS, LONG_TERM_THRESHOLDS
@@ -28,52 +29,159 @@ app = None
 reconnect_delay = 5  # seconds between reconnection attempts
 connection_check_interval = 10  # seconds between connection checks
 is_running = True
+# Updates handled at once, and how many of them may run blocking monitor calls in worker threads
+COMMAND_CONCURRENCY = 16
+BLOCKING_COMMAND_LIMIT = 4
+LIST_PAGE_SIZE = 25
+LIST_SORTS = {"symbol": "Symbol", "move": "24h move", "threshold": "Threshold"}
+
+async def run_blocking(context: ContextTypes.DEFAULT_TYPE, func, *args):
+   """Run a blocking monitor call off the event loop so other chats keep getting answers"""
+   async with context.bot_data["blocking_commands"]:
+       return await asyncio.to_thread(func, *args)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
    welcome_message = (
        "Welcome to the Crypto Price Movement Monitor!\n\n"
        "Available commands:\n"
-       "/add <coin_id> - Add a coin to monitor\n"
-       "/remove <coin_id> - Remove a coin from monitoring\n"
+       "/add <coin>[,<coin>...] - Add coins to monitor by ID or symbol\n"
+       "/remove <coin>[,<coin>...] - Remove coins from monitoring\n"
+       "/search <text> - Find coins by symbol or name\n"
        "/list - List all monitored coins\n"
        "/rules - Show current notification thresholds"
    )
    await update.message.reply_text(welcome_message)
 
+def parse_coin_args(args) -> list:
+   """Coin ids, symbols or names from command arguments separated by commas.
+
+   Spaces belong to the query, so "Bitcoin Cash, eth" is two coins, not three.
+   """
+   return [part.strip() for part in " ".join(args).split(',') if part.strip()]
+
+def coin_labels(coin_ids) -> str:
+   """Comma-separated "Name (SYMBOL)" for coin ids"""
+   labels = []
+   for coin_id in coin_ids:
+       # The loaded map only, so replying never waits for a metadata refresh
+       coin_info = price_monitor.get_coin_info(coin_id) or price_monitor.metadata.by_id.get(coin_id)
+       labels.append(f"{coin_info['name']} ({coin_info['symbol']})" if coin_info else str(coin_id))
+   return ", ".join(labels)
+
 async def add_coin(update: Update, context: ContextTypes.DEFAULT_TYPE):
-   try:
-       coin_id = int(context.args[0])
-       if price_monitor.add_coin(coin_id):
-           coin_info = price_monitor.get_coin_info(coin_id)
+   queries = parse_coin_args(context.args)
+   if not queries:
+       await update.message.reply_text("Please provide coin IDs or symbols: /add <coin>[,<coin>...]")
+       return
+
+   coin_ids, unresolved = await run_blocking(context, price_monitor.resolve_coins, queries)
+   result = await run_blocking(context, price_monitor.add_coins, coin_ids) if coin_ids else {"added": [], "existing": [], "missing": []}
+   result["missing"] += unresolved
+   if len(queries) == 1:
+       if result["added"] or result["existing"]:
+           coin_info = price_monitor.get_coin_info((result["added"] or result["existing"])[0])
            await update.message.reply_text(
                f"Added {coin_info['name']} ({coin_info['symbol']}) to watchlist"
            )
        else:
-           await update.message.reply_text("Failed to add coin. Please check the coin ID.")
-   except (ValueError, IndexError):
-       await update.message.reply_text("Please provide a valid coin ID: /add <coin_id>")
+           await update.message.reply_text("Failed to add coin. Please check the coin ID or symbol.")
+       return
+
+   lines = [f"Added {len(result['added'])} coins to watchlist" + (f": {coin_labels(result['added'])}" if result["added"] else "")]
+   if result["existing"]:
+       lines.append(f"Already watched: {coin_labels(result['existing'])}")
+   if result["missing"]:
+       lines.append(f"Not found: {', '.join(map(str, result['missing']))}")
+   await update.message.reply_text("\n".join(lines))
 
 async def remove_coin(update: Update, context: ContextTypes.DEFAULT_TYPE):
-   try:
-       coin_id = int(context.args[0])
-       if price_monitor.remove_coin(coin_id):
-           await update.message.reply_text("Coin removed from watchlist")
+   queries = parse_coin_args(context.args)
+   if not queries:
+       await update.message.reply_text("Please provide coin IDs or symbols: /remove <coin>[,<coin>...]")
+       return
+
+   # Only exact matches, so a typo can never remove some other watched coin
+   coin_ids, unresolved = await run_blocking(context, price_monitor.resolve_coins, queries, True)
+   # Names are looked up while the coins are still watched
+   labels = {coin_id: coin_labels([coin_id]) for coin_id in coin_ids}
+   result = await run_blocking(context, price_monitor.remove_coins, coin_ids)
+   result["missing"] += unresolved
+   if len(queries) == 1:
+       if result["removed"]:
+           await update.message.reply_text(f"Removed {labels[result['removed'][0]]} from watchlist")
        else:
-           await update.message.reply_text("Failed to remove coin. Please check the coin ID.")
-   except (ValueError, IndexError):
-       await update.message.reply_text("Please provide a valid coin ID: /remove <coin_id>")
+           await update.message.reply_text("Failed to remove coin. Please check the coin ID or symbol.")
+       return
 
-async def list_coins(update: Update, context: ContextTypes.DEFAULT_TYPE):
-   coins = price_monitor.get_monitored_coins()
-   if coins:
-       message = "Monitored coins:\n" + "\n".join(
+   lines = [f"Removed {len(result['removed'])} coins from watchlist" + (f": {', '.join(labels[c] for c in result['removed'])}" if result["removed"] else "")]
+   if result["missing"]:
+       lines.append(f"Not in watchlist: {', '.join(labels.get(c, str(c)) for c in result['missing'])}")
+   await update.message.reply_text("\n".join(lines))
+
+async def search_coins(update: Update, context: ContextTypes.DEFAULT_TYPE):
+   query = " ".join(context.args)
+   if not query:
+       await update.message.reply_text("Please provide a symbol or name: /search <text>")
+       return
+
+   matches = await run_blocking(context, price_monitor.metadata.search, query)
+   if matches:
+       message = f"Coins matching '{query}':\n" + "\n".join(
            f"{coin['name']} ({coin['symbol']}) - ID: {coin['id']}"
-           for coin in coins
+           + (f", rank #{coin['rank']}" if coin.get("rank") else "")
+           for coin in matches
        )
    else:
-       message = "No coins in watchlist"
+       message = f"No coins match '{query}'"
    await update.message.reply_text(message)
 
+def render_list_page(coins: list, sort: str, page: int):
+   """Text and inline keyboard for one page of the watchlist"""
+   pages = max(1, -(-len(coins) // LIST_PAGE_SIZE))
+   page = min(max(page, 0), pages - 1)
+   lines = []
+   for coin in coins[page * LIST_PAGE_SIZE:(page + 1) * LIST_PAGE_SIZE]:
+       line = f"{coin['name']} ({coin['symbol']}) - ID: {coin['id']}"
+       if sort == "move" and coin["change_24h"] is not None:
+           line += f" | 24h {coin['change_24h']:+.2f}%"
+       elif sort == "threshold" and coin["threshold_distance"] is not None:
+           line += f" | {max(0.0, coin['threshold_distance']):.2f}% to alert"
+       lines.append(line)
+   text = f"Monitored coins by {LIST_SORTS[sort].lower()} ({len(coins)}, page {page + 1}/{pages}):\n" + "\n".join(lines)
+
+   navigation = []
+   if page > 0:
+       navigation.append(InlineKeyboardButton("◀ Prev", callback_data=f"list:{sort}:{page - 1}"))
+   if page < pages - 1:
+       navigation.append(InlineKeyboardButton("Next ▶", callback_data=f"list:{sort}:{page + 1}"))
+   sorting = [
+       InlineKeyboardButton(("• " if key == sort else "") + label, callback_data=f"list:{key}:0")
+       for key, label in LIST_SORTS.items()
+   ]
+   return text, InlineKeyboardMarkup([row for row in (navigation, sorting) if row])
+
+async def list_coins(update: Update, context: ContextTypes.DEFAULT_TYPE):
+   coins = await run_blocking(context, price_monitor.get_watchlist_view, "symbol")
+   if not coins:
+       await update.message.reply_text("No coins in watchlist")
+       return
+   text, keyboard = render_list_page(coins, "symbol", 0)
+   await update.message.reply_text(text, reply_markup=keyboard)
+
+async def list_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+   query = update.callback_query
+   await query.answer()
+   _, sort, page = query.data.split(":")
+   if sort not in LIST_SORTS:
+       return
+   coins = await run_blocking(context, price_monitor.get_watchlist_view, sort)
+   if not coins:
+       await query.edit_message_text("No coins in watchlist")
+       return
+   text, keyboard = render_list_page(coins, sort, int(page))
+   if text != query.message.text:
+       await query.edit_message_text(text, reply_markup=keyboard)
+
 async def show_rules(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Format short-term thresholds
     short_term_rules = "\n".join([
@@ -157,8 +265,28 @@ def check_connection_background():
         # Wait before checking again
         time.sleep(connection_check_interval)
 
-def run_bot():
-    """Run the bot with automatic reconnection"""
+async def start_background_task(application: Application):
+    """Schedule the background coroutine on the bot's event loop once it is running"""
+    background_task = application.bot_data.get("background_task_factory")
+    if background_task:
+        application.bot_data["background_task"] = asyncio.create_task(background_task(application))
+
+async def stop_background_task(application: Application):
+    """Cancel the background coroutine and wait for it to finish cleaning up"""
+    task = application.bot_data.pop("background_task", None)
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+def run_bot(background_task=None):
+    """Run the bot with automatic reconnection.
+
+    background_task is an optional coroutine function taking the Application; it is
+    started on the bot's event loop after initialisation and cancelled when polling stops.
+    """
     global is_running
     
     # Start connection monitoring in a separate thread
@@ -168,13 +296,25 @@ def run_bot():
     while is_running:
         try:
             # Initialize the Application
-            application = Application.builder().token(TG_BOT_TOKEN).build()
+            application = (
+                Application.builder()
+                .token(TG_BOT_TOKEN)
+                .concurrent_updates(COMMAND_CONCURRENCY)
+                .post_init(start_background_task)
+                .post_stop(stop_background_task)
+                .build()
+            )
+            application.bot_data["background_task_factory"] = background_task
+            # One per application, since every restart runs on a fresh event loop
+            application.bot_data["blocking_commands"] = asyncio.Semaphore(BLOCKING_COMMAND_LIMIT)
             
             # Add handlers
             application.add_handler(CommandHandler("start", start))
             application.add_handler(CommandHandler("add", add_coin))
             application.add_handler(CommandHandler("remove", remove_coin))
             application.add_handler(CommandHandler("list", list_coins))
+            application.add_handler(CommandHandler("search", search_coins))
+            application.add_handler(CallbackQueryHandler(list_page, pattern=r"^list:"))
             application.add_handler(CommandHandler("rules", show_rules))
             application.add_error_handler(error_handler)
             
@@ -185,6 +325,9 @@ def run_bot():
             # Start the bot
             application.run_polling(drop_pending_updates=True)
             
+            # run_polling only returns once a stop signal was received
+            is_running = False
+            
         except (NetworkError, TimedOut, ConnectionError) as e:
             logger.error(f"❌🔴⚠️ NETWORK ERROR ⚠️🔴❌ Network error: {str(e)}")
             logger.info(f"Attempting to reconnect in {reconnect_delay} seconds...")
@@ -202,6 +345,10 @@ def run_bot():
             else:
                 logger.info("Bot has been stopped permanently.")
 
+async def run_write_behind(application: Application):
+    """Persist watchlist changes made through commands when the bot runs on its own"""
+    await price_monitor.run_write_behind()
+
 def main():
     # Set up signal handler for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
@@ -210,7 +357,8 @@ def main():
     global is_running
     
     # Run the bot
-    run_bot()
+    run_bot(background_task=run_write_behind)
+    price_monitor.close()
 
 if __name__ == "__main__":
    main()
\ No newline at end of file
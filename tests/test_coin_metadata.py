@@ -0,0 +1,131 @@
+import time
+import random
+import string
+
+import pytest
+
+import coin_metadata
+import price_monitor
+from coin_metadata import CoinMetadata
+
+COINS = [
+    {"id": 1, "name": "Bitcoin", "symbol": "BTC", "slug": "bitcoin", "rank": 1},
+    {"id": 1027, "name": "Ethereum", "symbol": "ETH", "slug": "ethereum", "rank": 2},
+    {"id": 1831, "name": "Bitcoin Cash", "symbol": "BCH", "slug": "bitcoin-cash", "rank": 20},
+    {"id": 3717, "name": "Wrapped Bitcoin", "symbol": "WBTC", "slug": "wrapped-bitcoin", "rank": 15},
+    {"id": 9998, "name": "Bitcoin Token", "symbol": "BITCOIN", "slug": "bitcoin-token", "rank": 4000},
+    {"id": 9999, "name": "Cash Coin", "symbol": "CASH", "slug": "cash-coin", "rank": None},
+    {"id": 5000, "name": "Ether Clone", "symbol": "ETH", "slug": "ether-clone", "rank": 3000},
+]
+
+class MemoryStorage:
+    def load_tokens(self):
+        return {}
+
+    def load_watchlist(self):
+        return {}
+
+    def write_changes(self, coins, tokens, notifications=None):
+        pass
+
+    def close(self):
+        pass
+
+def make_metadata(coins, tmp_path):
+    metadata = CoinMetadata(None, str(tmp_path / "coin_map.json"))
+    metadata._index(coins)
+    metadata.fetched_at = time.time()
+    return metadata
+
+@pytest.fixture
+def metadata(tmp_path):
+    return make_metadata(COINS, tmp_path)
+
+def test_resolve_exact_keys(metadata):
+    assert metadata.resolve("1831") == 1831
+    assert metadata.resolve("bitcoin-cash") == 1831
+    assert metadata.resolve("Bitcoin Cash") == 1831
+    assert metadata.resolve("bch") == 1831
+    # A shared symbol goes to the best ranked coin
+    assert metadata.resolve("ETH") == 1027
+    # "bitcoin" is a name, a slug and another token's symbol
+    assert metadata.resolve("bitcoin") == 1
+
+def test_resolve_fuzzy_only_when_asked(metadata):
+    assert metadata.resolve("Etherium") == 1027
+    assert metadata.resolve("Etherium", fuzzy=False) is None
+    assert metadata.resolve("zzzzzz") is None
+
+def test_search_orders_exact_then_prefix_then_fuzzy(metadata):
+    assert [c["id"] for c in metadata.search("cash")] == [9999, 1831]
+    assert [c["id"] for c in metadata.search("bitc")] == [1, 3717, 1831, 9998]
+    assert [c["id"] for c in metadata.search("bitc", 2)] == [1, 3717]
+    assert [c["id"] for c in metadata.search("etherem")][:1] == [1027]
+    assert metadata.search("  ") == []
+
+def test_remember_makes_a_coin_searchable(metadata):
+    metadata.remember(42, "Brand New", "BNEW")
+    assert metadata.resolve("bnew") == 42
+    assert [c["id"] for c in metadata.search("b")][-1] == 42
+    assert [c["id"] for c in metadata.search("bn")] == [42]
+
+def reference_search(coins, query, limit):
+    """Exact hits, then every prefix hit by rank, without indexes"""
+    query = query.strip().lower()
+    rank = lambda c: (c["rank"] or float('inf'), c["id"])
+    # Slugs and names are unique keys held by their best ranked coin; symbols are shared
+    exact = [c for c in coins if c["symbol"].lower() == query]
+    for key in ("slug", "name"):
+        matches = [c for c in coins if c[key].lower() == query]
+        exact += [min(matches, key=rank)] if matches else []
+    prefixed = [c for c in coins if any(k.startswith(query) for k in CoinMetadata._search_keys(c))]
+    found = {}
+    for coin in sorted(exact, key=rank) + sorted(prefixed, key=rank):
+        found.setdefault(coin["id"], coin)
+    return [c["id"] for c in found.values()][:limit]
+
+def test_short_prefixes_match_a_full_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(coin_metadata, "SHORT_PREFIX_TOP", 5)
+    rng = random.Random(0)
+    letters = "abc"
+    coins = []
+    for coin_id in range(1, 400):
+        name = " ".join("".join(rng.choice(letters) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 2)))
+        coins.append({
+            "id": coin_id, "name": name.title(), "symbol": "".join(rng.choice(letters) for _ in range(3)).upper(),
+            "slug": name.replace(" ", "-"), "rank": rng.choice([None, rng.randint(1, 1000)])
+        })
+    metadata = make_metadata(coins, tmp_path)
+    queries = ["a", "b", "c", "ab", "ba", "cc", "abc", "d"]
+    for query in queries:
+        for limit in (1, 3, 5, 8):
+            if reference_search(coins, query, limit) and len(reference_search(coins, query, 10**6)) >= limit:
+                assert [c["id"] for c in metadata.search(query, limit)] == reference_search(coins, query, limit), (query, limit)
+
+    # Coins remembered later land in the short prefix lists in rank order as well
+    for coin_id in range(1000, 1010):
+        metadata.remember(coin_id, f"Ab{coin_id}", f"A{coin_id}")
+        coins.append(metadata.by_id[coin_id])
+    for query in ["a", "ab"]:
+        assert [c["id"] for c in metadata.search(query, 5)] == reference_search(coins, query, 5)
+
+@pytest.fixture
+def monitor(metadata, monkeypatch):
+    monitor = price_monitor.PriceMonitor(storage=MemoryStorage())
+    monkeypatch.setattr(monitor, "metadata", metadata)
+    return monitor
+
+def test_exact_resolution_for_removals(monitor):
+    # A watched coin listed under another name than the map's wins over the map
+    monitor.watchlist = {1831: {"name": "Cash", "symbol": "BCH"}}
+    assert monitor.resolve_coins(["cash"], exact=True) == ([1831], [])
+    assert monitor.resolve_coins(["cash"]) == ([9999], [])
+    # Typos and partial names never match when exact
+    assert monitor.resolve_coins(["Bitcoin Cas", "Etherium", "1027"], exact=True) == ([1027], ["Bitcoin Cas", "Etherium"])
+    assert monitor.resolve_coins(["Bitcoin Cas", "Etherium"]) == ([1831, 1027], [])
+
+def test_match_watched_needs_the_full_symbol_or_name(monitor):
+    monitor.watchlist = {1: {"name": "Bitcoin", "symbol": "BTC"}, 1831: {"name": "Bitcoin Cash", "symbol": "BCH"}}
+    assert monitor._match_watched(" bitcoin cash ") == 1831
+    assert monitor._match_watched("BTC") == 1
+    assert monitor._match_watched("bitcoin c") is None
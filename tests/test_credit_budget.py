@@ -0,0 +1,86 @@
+import pytest
+
+from credit_budget import CreditBudget, COINS_PER_CREDIT, CMC_MAX_BATCH_SIZE
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def run_ticks(budget, clock, ticks, due_coins, tick_seconds=15):
+    """Throttle one tick after another, paying one credit per admitted call like a 100-coin batch"""
+    admitted = 0
+    for _ in range(ticks):
+        if budget.throttle(due_coins):
+            budget.record(1)
+            admitted += 1
+        clock.now += tick_seconds
+    return admitted
+
+def test_unlimited_plan_admits_everything():
+    clock = FakeClock()
+    budget = CreditBudget(0, 30, clock=clock)
+    assert run_ticks(budget, clock, 1000, {"hot": 50}) == 1000
+    assert budget.pace() == 1.0
+    assert budget.stats["paced_ticks"] == 0
+
+def test_demand_within_budget_is_not_paced():
+    clock = FakeClock()
+    # One credit every 15s is 172,800 a month
+    budget = CreditBudget(200_000, 30, clock=clock)
+    assert run_ticks(budget, clock, 5760, {"hot": 50}) == 5760
+    assert budget.pace() == 1.0
+
+@pytest.mark.parametrize("monthly", [86_400, 115_200, 50_000])
+def test_pacing_converges_to_the_budget(monthly):
+    clock = FakeClock()
+    budget = CreditBudget(monthly, 30, clock=clock)
+    # Warm up for a day so the rolling window describes a steady state, then measure a second day
+    run_ticks(budget, clock, 5760, {"hot": 50})
+    run_ticks(budget, clock, 5760, {"hot": 50})
+    assert budget.demanded_monthly_credits() == pytest.approx(172_800, rel=0.01)
+    assert budget.projected_monthly_credits() == pytest.approx(monthly, rel=0.05)
+
+def test_fractional_pace_keeps_its_share_of_polls():
+    clock = FakeClock()
+    budget = CreditBudget(115_200, 30, clock=clock)
+    # Demand is 1.5x the plan: two polls in three, not one in two
+    run_ticks(budget, clock, 5760, {"hot": 50})
+    admitted = run_ticks(budget, clock, 3000, {"hot": 50})
+    assert admitted / 3000 == pytest.approx(2 / 3, abs=0.02)
+
+def test_each_tier_is_paced_on_its_own():
+    clock = FakeClock()
+    budget = CreditBudget(86_400, 30, clock=clock)
+    run_ticks(budget, clock, 5760, {"hot": 50})
+    counts = {"hot": 0, "tail": 0}
+    for _ in range(400):
+        for tier in budget.throttle({"hot": 50, "tail": 50}):
+            counts[tier] += 1
+            budget.record(1)
+        clock.now += 15
+    # Neither tier is starved by the other
+    assert counts["hot"] == pytest.approx(counts["tail"], abs=2)
+    assert 0 < counts["hot"] < 400
+
+def test_batch_size_prefers_cheapest_batches():
+    clock = FakeClock()
+    budget = CreditBudget(0, 30, clock=clock)
+    assert budget.batch_size(250) == COINS_PER_CREDIT
+    assert budget.batch_size(3000) == COINS_PER_CREDIT
+
+def test_batch_size_grows_when_calls_run_short():
+    clock = FakeClock()
+    budget = CreditBudget(0, 30, clock=clock)
+    for _ in range(28):
+        budget.record(1)
+    # Two calls left this minute for 1,000 coins
+    assert budget.batch_size(1000) == 500
+    for _ in range(5):
+        budget.record(1)
+    assert budget.batch_size(50_000) == CMC_MAX_BATCH_SIZE
+    # The minute rolls over and the calls are available again
+    clock.now += 61
+    assert budget.batch_size(1000) == COINS_PER_CREDIT
@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+import pytest
+
+from digest import DigestBuffer, build_digests, TELEGRAM_MESSAGE_LIMIT
+from price_monitor import format_digest_line
+
+def make_notifications(count, kind="short_term"):
+    return [{
+        "coin_id": i,
+        "coin_name": f"Coin {i}",
+        "coin_symbol": f"SYM{i}",
+        "current_price": 1000.0 + i,
+        "price_change": (i % 97) - 48.5,
+        "time_elapsed": timedelta(minutes=5),
+        "type": kind
+    } for i in range(count)]
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.mark.parametrize("count", [2, 150, 1000, 10_000])
+def test_digests_fit_the_message_limit(count):
+    notifications = make_notifications(count)
+    digests = build_digests(notifications, format_digest_line)
+    assert all(len(d["text"]) <= TELEGRAM_MESSAGE_LIMIT for d in digests)
+    # Every notification goes out exactly once
+    packed = [n["coin_id"] for d in digests for n in d["notifications"]]
+    assert sorted(packed) == list(range(count))
+    # Text and notification lists stay in step
+    assert sum(len(d["text"].splitlines()) - 1 for d in digests) == count
+
+def test_digests_are_packed_tightly():
+    notifications = make_notifications(1000)
+    digests = build_digests(notifications, format_digest_line)
+    line = max(len(format_digest_line(n)) for n in notifications) + 1
+    # All but the last part are full to within one line of the budget
+    for d in digests[:-1]:
+        assert len(d["text"]) > TELEGRAM_MESSAGE_LIMIT - 64 - line
+    assert digests[0]["text"].startswith(f"Market move: 1000 alerts (1/{len(digests)})")
+
+def test_biggest_moves_come_first():
+    digests = build_digests(make_notifications(300), format_digest_line)
+    changes = [abs(n["price_change"]) for d in digests for n in d["notifications"]]
+    assert changes == sorted(changes, reverse=True)
+
+def test_overlong_line_is_cut_to_fit():
+    notifications = make_notifications(2)
+    digests = build_digests(notifications, lambda n: "x" * 10_000)
+    assert len(digests) == 2
+    assert all(len(d["text"]) <= TELEGRAM_MESSAGE_LIMIT for d in digests)
+
+def test_single_part_has_no_part_counter():
+    digests = build_digests(make_notifications(3), format_digest_line)
+    assert len(digests) == 1
+    assert digests[0]["text"].splitlines()[0] == "Market move: 3 alerts"
+
+def test_buffer_passes_other_types_through():
+    buffer = DigestBuffer({"short_term"}, 0, format_digest_line, clock=FakeClock())
+    notifications = make_notifications(3) + make_notifications(2, kind="long_term")
+    immediate = buffer.add(notifications)
+    assert [n["type"] for n in immediate] == ["long_term", "long_term"]
+    messages = buffer.take()
+    assert len(messages) == 1 and messages[0]["type"] == "digest"
+    assert buffer.stats == {"notifications": 5, "messages": 3}
+    assert buffer.take() == []
+
+def test_buffer_sends_a_lone_notification_unchanged():
+    buffer = DigestBuffer({"short_term"}, 0, format_digest_line, clock=FakeClock())
+    notification = make_notifications(1)
+    buffer.add(notification)
+    assert buffer.take() == notification
+
+def test_buffer_waits_for_the_window():
+    clock = FakeClock()
+    buffer = DigestBuffer({"short_term"}, 30, format_digest_line, clock=clock)
+    assert not buffer.ready()
+    buffer.add(make_notifications(2))
+    clock.now += 20
+    buffer.add(make_notifications(2))
+    # The window runs from the first buffered notification
+    assert not buffer.ready()
+    clock.now += 10
+    assert buffer.ready()
+    assert len(buffer.take()[0]["notifications"]) == 4
+    assert not buffer.ready()
@@ -0,0 +1,146 @@
+import time
+import asyncio
+
+import pytest
+
+import notifier
+from notifier import TokenBucket, TelegramRateLimiter, NotificationQueue, ThreadedNotificationQueue, TelegramRetryAfter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_bucket_serves_the_burst_then_queues_at_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Reservations beyond the burst line up one interval apart
+    assert [bucket.reserve() for _ in range(3)] == pytest.approx([0.5, 1.0, 1.5])
+
+def test_bucket_refills_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=2, clock=clock)
+    bucket.reserve()
+    bucket.reserve()
+    clock.now = 100.0
+    assert [bucket.reserve() for _ in range(3)] == pytest.approx([0.0, 0.0, 1.0])
+
+def test_pause_holds_back_the_next_token():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=5, clock=clock)
+    bucket.pause(10)
+    assert bucket.reserve() == pytest.approx(11.0)
+    clock.now = 11.0
+    assert bucket.reserve() == pytest.approx(1.0)
+
+def test_limiter_applies_chat_and_global_limits():
+    clock = FakeClock()
+    limiter = TelegramRateLimiter(global_rate=30, chat_rate=1, clock=clock)
+    # The per-chat burst runs out first
+    assert [limiter.reserve("a") for _ in range(4)] == pytest.approx([0.0, 0.0, 0.0, 1.0])
+    assert limiter.reserve("b") == 0.0
+
+    limiter.retry_after("a", 5)
+    # A 429 pauses the global bucket too, so every chat waits it out
+    assert limiter.reserve("b") >= 5.0
+
+def test_submit_leaves_alerts_in_the_outbox_past_the_overflow_cap():
+    notification_queue = NotificationQueue(None, maxsize=2, overflow_size=2)
+    assert [notification_queue.submit({"outbox_id": i}) for i in range(6)] == [True] * 4 + [False] * 2
+    assert notification_queue.depth() == 4
+    stats = notification_queue.stats
+    assert (stats["enqueued"], stats["overflowed"], stats["outboxed"]) == (4, 2, 2)
+
+def test_threaded_submit_leaves_alerts_in_the_outbox_past_the_overflow_cap():
+    notification_queue = ThreadedNotificationQueue(None, workers=1, maxsize=2, overflow_size=2)
+    assert [notification_queue.submit({"outbox_id": i}) for i in range(6)] == [True] * 4 + [False] * 2
+    assert len(notification_queue.overflow) == 2
+    stats = notification_queue.stats
+    assert (stats["enqueued"], stats["overflowed"], stats["outboxed"]) == (4, 2, 2)
+    # Shutdown sentinels are never refused, however full the overflow is
+    notification_queue._put(None)
+    assert len(notification_queue.overflow) == 3
+
+def unlimited():
+    return TelegramRateLimiter(global_rate=1e9, chat_rate=1e9)
+
+@pytest.fixture
+def quick_backoff(monkeypatch):
+    monkeypatch.setattr(notifier, "RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(notifier, "MAX_SEND_ATTEMPTS", 4)
+
+def test_failed_deliveries_back_off_then_go_to_on_failed(quick_backoff):
+    attempts, failed = [], []
+
+    async def send(notification):
+        attempts.append(time.monotonic())
+        raise RuntimeError("Bad Request: can't parse entities")
+
+    async def run():
+        notification_queue = NotificationQueue(send, workers=1, limiter=unlimited(), on_failed=failed.append)
+        notification_queue.start()
+        notification_queue.submit({"outbox_id": 1})
+        await notification_queue.close()
+        return notification_queue
+
+    notification_queue = asyncio.run(run())
+    assert len(attempts) == 4
+    gaps = [later - earlier for earlier, later in zip(attempts, attempts[1:])]
+    # 10ms, 20ms and 40ms apart
+    assert all(gap >= 0.01 * 2 ** i * 0.9 for i, gap in enumerate(gaps))
+    assert failed == [{"outbox_id": 1}]
+    assert notification_queue.stats["failed"] == 1
+    assert notification_queue.in_flight == set()
+
+def test_rate_limited_deliveries_do_not_back_off(quick_backoff, monkeypatch):
+    monkeypatch.setattr(notifier, "RETRY_BACKOFF", 60)
+    sent = []
+
+    async def send(notification):
+        if not sent:
+            sent.append(None)
+            raise TelegramRetryAfter(0)
+        sent.append(notification)
+        return True
+
+    async def run():
+        notification_queue = NotificationQueue(send, workers=1, limiter=unlimited())
+        notification_queue.start()
+        notification_queue.submit({"outbox_id": 1})
+        await notification_queue.close(timeout=5)
+        return notification_queue
+
+    notification_queue = asyncio.run(run())
+    assert sent[1:] == [{"outbox_id": 1}]
+    assert notification_queue.stats["sent"] == 1
+
+def test_submit_pending_skips_alerts_on_their_way():
+    notification_queue = NotificationQueue(None, maxsize=10)
+    first, second = {"outbox_id": 1}, {"outbox_id": 2}
+    notification_queue.submit({"type": "digest", "notifications": [first]})
+    assert notification_queue.submit_pending([first, second]) == 1
+    assert notification_queue.in_flight == {1, 2}
+    assert notification_queue.depth() == 2
+
+def test_threaded_queue_gives_up_then_accepts_a_resubmit(quick_backoff):
+    attempts, failed = [], []
+
+    def send(notification):
+        attempts.append(notification)
+        return len(attempts) > 4
+
+    notification_queue = ThreadedNotificationQueue(send, workers=1, limiter=unlimited(), on_failed=failed.append)
+    notification_queue.start()
+    notification_queue.submit({"outbox_id": 1})
+    deadline = time.monotonic() + 5
+    while not failed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert failed == [{"outbox_id": 1}]
+    # Released once given up on, so the next re-submit sends it again
+    assert notification_queue.submit_pending([{"outbox_id": 1}]) == 1
+    notification_queue.close(timeout=5)
+    assert notification_queue.stats["sent"] == 1
+    assert len(attempts) == 5
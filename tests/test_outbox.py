@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+import outbox
+from outbox import Outbox
+
+def alert(coin_id):
+    return {"coin_id": coin_id, "type": "short_term", "price_change": 1.5, "time_elapsed": timedelta(minutes=5)}
+
+def test_replay_returns_only_unsent(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    box = Outbox(path)
+    first, second, third = alert(1), alert(2), alert(3)
+    box.add([first, second, third])
+    box.mark_sent(second)
+    box.close()
+
+    replayed = Outbox(path)
+    assert [n["coin_id"] for n in replayed.pending()] == [1, 3]
+    assert replayed.pending()[0]["time_elapsed"] == timedelta(minutes=5)
+    # Ids keep counting after the replayed ones
+    fourth = alert(4)
+    replayed.add([fourth])
+    assert fourth["outbox_id"] == 4
+
+def test_replay_skips_a_torn_record(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    box = Outbox(path)
+    box.add([alert(1)])
+    box.close()
+    with open(path, "a") as f:
+        f.write('{"op": "sent", "i')
+    assert [n["coin_id"] for n in Outbox(path).pending()] == [1]
+
+def test_digest_acknowledges_every_alert_inside(tmp_path):
+    box = Outbox(str(tmp_path / "outbox.log"))
+    alerts = [alert(1), alert(2)]
+    box.add(alerts)
+    box.mark_sent({"type": "digest", "notifications": alerts})
+    assert box.pending() == []
+
+def test_sync_compacts_once_nothing_is_pending(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_COMPACT_RECORDS", 4)
+    path = tmp_path / "outbox.log"
+    box = Outbox(str(path))
+    alerts = [alert(1), alert(2)]
+    box.add(alerts)
+    box.mark_sent(alerts[0])
+    box.sync()
+    # One alert is still pending, so the log keeps growing
+    assert len(path.read_text().splitlines()) == 3
+
+    box.mark_sent(alerts[1])
+    box.sync()
+    assert path.read_text() == ""
+    box.add([alert(3)])
+    box.close()
+    assert [n["coin_id"] for n in Outbox(str(path)).pending()] == [3]
+
+def test_failed_runs_survive_a_restart_until_the_alert_is_dead(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_FAILED_RUNS", 3)
+    path = str(tmp_path / "outbox.log")
+    box = Outbox(path)
+    stuck, fine = alert(1), alert(2)
+    box.add([stuck, fine])
+    assert box.mark_failed(stuck) == 0
+    box.close()
+
+    # The replay rewrites the log but keeps the count
+    box = Outbox(path)
+    assert box.mark_failed(box.pending()[0]) == 0
+    box.close()
+
+    box = Outbox(path)
+    assert box.mark_failed({"type": "digest", "notifications": box.pending()}) == 1
+    assert [n["coin_id"] for n in box.pending()] == [2]
+    box.close()
+    assert [n["coin_id"] for n in Outbox(path).pending()] == [2]
+
+def test_dead_alerts_let_the_log_compact(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_FAILED_RUNS", 1)
+    monkeypatch.setattr(outbox, "OUTBOX_COMPACT_RECORDS", 2)
+    path = tmp_path / "outbox.log"
+    box = Outbox(str(path))
+    stuck = alert(1)
+    box.add([stuck])
+    assert box.mark_failed(stuck) == 1
+    # Acknowledging it afterwards is a no-op
+    box.mark_sent(stuck)
+    box.sync()
+    assert path.read_text() == ""
+    box.close()
@@ -0,0 +1,154 @@
+import copy
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import price_monitor
+
+TRIALS = 300
+
+class MemoryStorage:
+    def load_tokens(self):
+        return {}
+
+    def load_watchlist(self):
+        return {}
+
+    def write_changes(self, coins, tokens, notifications=None):
+        pass
+
+    def close(self):
+        pass
+
+def _minutes(threshold):
+    # timedelta(minutes=inf) overflows, which made the old loop skip the coin altogether
+    return 10**9 if threshold["minutes"] == float('inf') else threshold["minutes"]
+
+def reference_evaluate(watchlist, current_prices, current_time):
+    """The per-coin loop the NumPy engine replaced, without its logging"""
+    notifications = []
+    absolute_notifications = []
+    for coin_id in list(watchlist.keys()):
+        coin_info = watchlist[coin_id]
+        if coin_id not in current_prices:
+            continue
+        current_price = current_prices[coin_id]
+
+        if coin_info["short_term"]["last_price"] is None or coin_info["long_term"]["last_price"] is None:
+            coin_info["short_term"] = {"last_price": current_price, "last_notification_time": current_time}
+            coin_info["long_term"] = {"last_price": current_price, "last_notification_time": current_time}
+            continue
+
+        short_term_price = coin_info["short_term"]["last_price"]
+        long_term_price = coin_info["long_term"]["last_price"]
+        short_term_change_percent = ((current_price - short_term_price) / short_term_price) * 100
+        long_term_change_percent = ((current_price - long_term_price) / long_term_price) * 100
+
+        if abs(short_term_change_percent) >= 2.0:
+            absolute_notifications.append({
+                "coin_name": coin_info["name"],
+                "coin_symbol": coin_info["symbol"],
+                "current_price": current_price,
+                "price_change": short_term_change_percent,
+                "type": "absolute",
+                "coin_id": coin_id
+            })
+
+        for threshold in price_monitor.SHORT_TERM_THRESHOLDS:
+            elapsed = current_time - coin_info["short_term"]["last_notification_time"]
+            if abs(short_term_change_percent) >= threshold["percent"] and elapsed <= timedelta(minutes=_minutes(threshold)):
+                notifications.append({
+                    "coin_name": coin_info["name"],
+                    "coin_symbol": coin_info["symbol"],
+                    "current_price": current_price,
+                    "price_change": short_term_change_percent,
+                    "time_elapsed": elapsed,
+                    "type": "short_term",
+                    "coin_id": coin_id
+                })
+                break
+
+        for threshold in price_monitor.LONG_TERM_THRESHOLDS:
+            elapsed = current_time - coin_info["long_term"]["last_notification_time"]
+            if abs(long_term_change_percent) >= threshold["percent"] and elapsed <= timedelta(minutes=_minutes(threshold)):
+                notifications.append({
+                    "coin_name": coin_info["name"],
+                    "coin_symbol": coin_info["symbol"],
+                    "current_price": current_price,
+                    "price_change": long_term_change_percent,
+                    "time_elapsed": elapsed,
+                    "type": "long_term",
+                    "coin_id": coin_id
+                })
+                coin_info["long_term"] = {"last_price": current_price, "last_notification_time": current_time}
+                break
+
+    for abs_notif in absolute_notifications:
+        # A short-term alert for the same symbol suppresses the absolute one
+        if not any(n["coin_symbol"] == abs_notif["coin_symbol"] and n["type"] == "short_term" for n in notifications):
+            notifications.append(abs_notif)
+
+    for notification in notifications:
+        if notification["type"] in ("short_term", "absolute"):
+            watchlist[notification["coin_id"]]["short_term"] = {
+                "last_price": notification["current_price"],
+                "last_notification_time": current_time
+            }
+    return notifications
+
+def random_market(rng, now):
+    watchlist, prices = {}, {}
+    for coin_id in range(1, 60):
+        # Shared symbols exercise the overlap rule across coins
+        symbol = rng.choice(["A", "B", "C", f"S{coin_id}"])
+        if rng.random() < 0.1:
+            short_price = rng.choice([None, 100.0, rng.uniform(1, 100)])
+        else:
+            short_price = rng.uniform(1, 100)
+        long_price = rng.uniform(1, 100)
+        short_age = rng.choice([rng.uniform(0, 40), 2, 5, 10, 30])
+        watchlist[coin_id] = {
+            "short_term": {"last_price": short_price, "last_notification_time": now - timedelta(minutes=short_age)},
+            "long_term": {"last_price": long_price, "last_notification_time": now - timedelta(minutes=rng.uniform(0, 3000))},
+            "name": f"Coin {coin_id}",
+            "symbol": symbol
+        }
+        if rng.random() < 0.95:
+            base = short_price or long_price
+            prices[coin_id] = base * (1 + rng.uniform(-0.05, 0.05)) if rng.random() < 0.9 else base
+    return watchlist, prices
+
+def _rounded(notifications):
+    return [{k: round(v, 9) if isinstance(v, float) else v for k, v in n.items()} for n in notifications]
+
+@pytest.fixture
+def fixed_now(monkeypatch):
+    now = datetime(2026, 1, 1, 12, 0, 0)
+
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+    monkeypatch.setattr(price_monitor, "datetime", FixedDatetime)
+    # The reference loop knows none of the optional modes, whatever the environment sets
+    monkeypatch.setattr(price_monitor, "INCREMENTAL_EVALUATION", False)
+    monkeypatch.setattr(price_monitor, "WINDOWED_DETECTION", False)
+    monkeypatch.setattr(price_monitor, "DYNAMIC_TIERING", False)
+    monkeypatch.setattr(price_monitor, "PRICE_HISTORY_FILE", None)
+    return now
+
+def test_engine_matches_reference_loop(fixed_now):
+    rng = random.Random(0)
+    for trial in range(TRIALS):
+        watchlist, prices = random_market(rng, fixed_now - timedelta(seconds=1))
+        expected_watchlist = copy.deepcopy(watchlist)
+        expected = reference_evaluate(expected_watchlist, prices, fixed_now)
+
+        monitor = price_monitor.PriceMonitor(storage=MemoryStorage())
+        monitor.watchlist = watchlist
+        actual = monitor._evaluate_price_movements(dict(prices))
+
+        assert _rounded(actual) == _rounded(expected), f"trial {trial}"
+        assert monitor.watchlist == expected_watchlist, f"trial {trial}"
@@ -0,0 +1,69 @@
+import pytest
+
+import scheduler
+from scheduler import PollScheduler
+
+TIERS = {"hot": 15, "default": 60, "tail": 300}
+
+class FakeClock:
+    """Monotonic and wall clocks that only move when the scheduler sleeps or work is simulated"""
+
+    def __init__(self, wall):
+        self.monotonic = 1000.0
+        self.wall = wall
+
+    def advance(self, seconds):
+        self.monotonic += seconds
+        self.wall += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(wall=1_700_000_007.0)
+    monkeypatch.setattr(scheduler.time, "sleep", clock.advance)
+    return clock
+
+def make_scheduler(clock):
+    return PollScheduler(TIERS, clock=lambda: clock.monotonic, wall_clock=lambda: clock.wall)
+
+def test_first_deadline_is_aligned_to_the_wall_clock(clock):
+    poll = make_scheduler(clock)
+    assert poll.tick == 15
+    poll.wait()
+    assert clock.wall % 15 == 0
+
+def test_tiers_fire_on_their_own_boundaries(clock):
+    poll = make_scheduler(clock)
+    fired = {tier: 0 for tier in TIERS}
+    for _ in range(40):  # ten minutes of 15s ticks
+        due = poll.wait()
+        for tier in due:
+            fired[tier] += 1
+        if "tail" in due:
+            assert clock.wall % 300 == 0
+    assert fired == {"hot": 40, "default": 10, "tail": 2}
+
+def test_deadlines_do_not_drift_with_work(clock):
+    poll = make_scheduler(clock)
+    poll.wait()
+    start = clock.wall
+    for _ in range(10):
+        clock.advance(4.0)  # time spent fetching and sending
+        poll.wait()
+    assert clock.wall == start + 10 * 15
+
+def test_overrun_skips_ticks_and_carries_their_tiers(clock):
+    poll = make_scheduler(clock)
+    # Run until the tick before a five-minute boundary
+    while (clock.wall + 15) % 300 != 0:
+        poll.wait()
+    boundary = clock.wall + 15
+    # This cycle runs 25s past the five-minute boundary, missing that tick entirely
+    clock.advance(40.0)
+    due = poll.wait()
+    assert due == {"hot", "default", "tail"}
+    assert clock.wall == boundary + 25
+    assert poll.stats["overruns"] == 1
+    assert poll.stats["missed_ticks"] == 1
+    # Back on the grid: the next tick is an ordinary hot-only one
+    assert poll.wait() == {"hot"}
+    assert clock.wall == boundary + 30
@@ -0,0 +1,95 @@
+from datetime import datetime
+
+import pytest
+
+from storage import BinaryStorage, JournalStorage
+
+TOKEN = {"name": "Bitcoin", "symbol": "BTC"}
+
+def entry(price, name="Bitcoin", symbol="BTC"):
+    stamp = datetime(2026, 1, 1, 12, 0, 0).isoformat()
+    return {
+        "name": name,
+        "symbol": symbol,
+        "short_term": {"last_price": price, "last_notification_time": stamp},
+        "long_term": {"last_price": price, "last_notification_time": stamp}
+    }
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def test_journal_replays_past_a_torn_line(workdir):
+    storage = JournalStorage()
+    storage.write_changes({1: entry(100.0)}, {1: TOKEN})
+    storage.write_changes({1: entry(110.0)}, {})
+    storage._journal.close()
+    # A crash mid-append leaves half a record at the end of the journal
+    with open("watchlist.journal", "a") as f:
+        f.write('{"op":"anchor","id":1,"h":"short')
+
+    restarted = JournalStorage()
+    assert restarted.load_tokens() == {1: TOKEN}
+    assert restarted.load_watchlist()[1]["short_term"]["last_price"] == 110.0
+
+    # The next append must not be glued onto the torn line
+    restarted.write_changes({2: entry(5.0, "Ether", "ETH")}, {})
+    assert set(JournalStorage().load_watchlist()) == {1, 2}
+
+def test_journal_sees_other_process_appends(workdir):
+    bot, monitor = JournalStorage(compact_after=2), JournalStorage(compact_after=2)
+    bot.write_changes({1: entry(100.0)}, {1: TOKEN})
+    assert monitor.load_tokens() == {1: TOKEN}
+
+    # The second record compacts, replacing the journal under the other replica
+    bot.write_changes({}, {2: {"name": "Ether", "symbol": "ETH"}})
+    monitor.write_changes({1: entry(120.0)}, {})
+    assert set(bot.load_tokens()) == {1, 2}
+    assert bot.load_watchlist()[1]["short_term"]["last_price"] == 120.0
+
+def test_binary_reuses_freed_slots(workdir):
+    storage = BinaryStorage(initial_capacity=4)
+    storage.write_changes({1: entry(1.0), 2: entry(2.0), 3: entry(3.0)}, {})
+    freed = storage._slots[2]
+    storage.write_changes({2: None}, {})
+    storage.write_changes({4: entry(4.0)}, {})
+    assert storage._slots[4] == freed
+    assert storage._capacity() == 4
+
+def test_binary_grows_when_full(workdir):
+    storage = BinaryStorage(initial_capacity=2)
+    storage.write_changes({coin_id: entry(float(coin_id)) for coin_id in range(1, 6)}, {})
+    assert storage._capacity() == 64
+    storage.close()
+
+    reopened = BinaryStorage()
+    prices = {coin_id: info["short_term"]["last_price"] for coin_id, info in reopened.load_watchlist().items()}
+    assert prices == {coin_id: float(coin_id) for coin_id in range(1, 6)}
+
+def test_binary_processes_never_share_a_slot(workdir):
+    bot, monitor = BinaryStorage(initial_capacity=2), BinaryStorage(initial_capacity=2)
+    bot.write_changes({1: entry(1.0)}, {})
+    monitor.write_changes({2: entry(2.0)}, {})
+    # Growing in one process remaps the file in the other
+    bot.write_changes({3: entry(3.0)}, {})
+    monitor.write_changes({4: entry(4.0)}, {})
+    assert sorted(bot.load_watchlist()) == [1, 2, 3, 4]
+    assert len(set(monitor._slots.values())) == 4
+
+def test_binary_anchor_updates_skip_the_reindex(workdir, monkeypatch):
+    bot, monitor = BinaryStorage(), BinaryStorage()
+    bot.write_changes({1: entry(1.0)}, {})
+    monitor.load_watchlist()
+
+    reindexed = []
+    original = BinaryStorage._reindex
+    monkeypatch.setattr(BinaryStorage, "_reindex", lambda self: reindexed.append(self) or original(self))
+    # Same coin, new anchor: the layout generation does not move
+    bot.write_changes({1: entry(2.0)}, {})
+    assert monitor.load_watchlist()[1]["short_term"]["last_price"] == 2.0
+    assert reindexed == []
+
+    bot.write_changes({2: entry(3.0)}, {})
+    assert sorted(monitor.load_watchlist()) == [1, 2]
+    assert reindexed == [monitor]
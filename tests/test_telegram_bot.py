@@ -0,0 +1,81 @@
+import time
+import asyncio
+import importlib
+
+import pytest
+
+from coin_metadata import CoinMetadata
+
+COINS = [
+    {"id": 1, "name": "Bitcoin", "symbol": "BTC", "slug": "bitcoin", "rank": 1},
+    {"id": 1027, "name": "Ethereum", "symbol": "ETH", "slug": "ethereum", "rank": 2},
+    {"id": 1831, "name": "Bitcoin Cash", "symbol": "BCH", "slug": "bitcoin-cash", "rank": 20},
+    {"id": 9999, "name": "Cash Coin", "symbol": "CASH", "slug": "cash-coin", "rank": 900},
+]
+
+class Message:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+class Update:
+    def __init__(self):
+        self.message = Message()
+
+class Context:
+    def __init__(self, args):
+        self.args = args
+        self.bot_data = {"blocking_commands": asyncio.Semaphore(1)}
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    # Importing the bot builds its monitor, which keeps its files in the working directory
+    monkeypatch.chdir(tmp_path)
+    telegram_bot = importlib.import_module("telegram_bot")
+    metadata = CoinMetadata(None, str(tmp_path / "coin_map.json"))
+    metadata._index(COINS)
+    metadata.fetched_at = time.time()
+    monitor = telegram_bot.price_monitor
+    monkeypatch.setattr(monitor, "metadata", metadata)
+    monkeypatch.setattr(monitor, "watchlist", {})
+    monkeypatch.setattr(monitor, "tokens", {})
+    return telegram_bot
+
+def run_command(handler, text):
+    update = Update()
+    asyncio.run(handler(update, Context(text.split())))
+    return update.message.replies[-1]
+
+def test_commas_separate_coins_and_spaces_do_not(bot):
+    assert bot.parse_coin_args(["Bitcoin", "Cash"]) == ["Bitcoin Cash"]
+    assert bot.parse_coin_args(["btc,", "Bitcoin", "Cash,eth"]) == ["btc", "Bitcoin Cash", "eth"]
+    assert bot.parse_coin_args([",", " "]) == []
+
+def test_add_resolves_a_name_with_spaces_as_one_coin(bot):
+    assert run_command(bot.add_coin, "Bitcoin Cash") == "Added Bitcoin Cash (BCH) to watchlist"
+    assert list(bot.price_monitor.watchlist) == [1831]
+
+def test_bulk_add_lists_the_coins(bot):
+    run_command(bot.add_coin, "btc")
+    reply = run_command(bot.add_coin, "Bitcoin Cash, eth, btc, nosuchcoinatall")
+    assert reply.splitlines() == [
+        "Added 2 coins to watchlist: Bitcoin Cash (BCH), Ethereum (ETH)",
+        "Already watched: Bitcoin (BTC)",
+        "Not found: nosuchcoinatall",
+    ]
+
+def test_remove_takes_only_the_named_coin(bot):
+    run_command(bot.add_coin, "btc, Bitcoin Cash")
+    assert run_command(bot.remove_coin, "Bitcoin Cash") == "Removed Bitcoin Cash (BCH) from watchlist"
+    assert list(bot.price_monitor.watchlist) == [1]
+
+def test_bulk_remove_lists_the_coins(bot):
+    run_command(bot.add_coin, "btc, eth, bch")
+    reply = run_command(bot.remove_coin, "BTC, Ethereum, Cash, nosuchcoin")
+    assert reply.splitlines() == [
+        "Removed 2 coins from watchlist: Bitcoin (BTC), Ethereum (ETH)",
+        "Not in watchlist: Cash Coin (CASH), nosuchcoin",
+    ]
+    assert list(bot.price_monitor.watchlist) == [1831]
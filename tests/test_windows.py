@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import price_monitor
+from price_history import WindowExtrema
+
+class MemoryStorage:
+    def load_tokens(self):
+        return {}
+
+    def load_watchlist(self):
+        return {}
+
+    def write_changes(self, coins, tokens, notifications=None):
+        pass
+
+    def close(self):
+        pass
+
+class Clock:
+    def __init__(self):
+        self.now = datetime(2026, 1, 1, 12, 0, 0)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+
+    class ClockDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return clock.now
+
+    monkeypatch.setattr(price_monitor, "datetime", ClockDatetime)
+    monkeypatch.setattr(price_monitor, "WINDOWED_DETECTION", True)
+    monkeypatch.setattr(price_monitor, "DYNAMIC_TIERING", False)
+    monkeypatch.setattr(price_monitor, "PRICE_HISTORY_FILE", None)
+    return clock
+
+def make_monitor(clock, price):
+    monitor = price_monitor.PriceMonitor(storage=MemoryStorage())
+    # Anchors too old for any short-term threshold, so only the windows can fire
+    anchor_time = clock.now - timedelta(hours=2)
+    monitor.watchlist = {1: {
+        "name": "Bitcoin",
+        "symbol": "BTC",
+        "short_term": {"last_price": price, "last_notification_time": anchor_time},
+        "long_term": {"last_price": price, "last_notification_time": anchor_time}
+    }}
+    return monitor
+
+def run_minutes(monitor, clock, prices):
+    fired = []
+    for price in prices:
+        fired.append(monitor._evaluate_price_movements({1: price}))
+        clock.now += timedelta(minutes=1)
+    return fired
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_window_sees_quotes_the_incremental_mode_skips(clock, monkeypatch, incremental):
+    monkeypatch.setattr(price_monitor, "INCREMENTAL_EVALUATION", incremental)
+    monitor = make_monitor(clock, 100.0)
+    # 99.9 is first seen at minute 1 and only repeated afterwards
+    fired = run_minutes(monitor, clock, [100.0, 99.9, 99.9, 99.9, 99.9, 100.15])
+
+    assert fired[:5] == [[]] * 5
+    assert [n["type"] for n in fired[5]] == ["short_term"]
+    assert fired[5][0]["price_change"] == pytest.approx(0.25, abs=0.01)
+
+def test_incremental_mode_skips_unchanged_quotes(clock, monkeypatch):
+    monkeypatch.setattr(price_monitor, "INCREMENTAL_EVALUATION", True)
+    monitor = make_monitor(clock, 100.0)
+    evaluated = []
+    original = price_monitor.rule_engine.evaluate
+    monkeypatch.setattr(
+        price_monitor.rule_engine, "evaluate",
+        lambda columns, *args: evaluated.append(len(columns)) or original(columns, *args)
+    )
+    run_minutes(monitor, clock, [100.0, 100.0, 100.05, 100.05])
+    assert evaluated == [1, 0, 1, 0]
+
+def test_window_extrema_track_the_window():
+    window = WindowExtrema(120)
+    for timestamp, price in [(0, 10.0), (60, 12.0), (120, 11.0)]:
+        window.push(timestamp, price)
+    assert window.minimum() == (0, 10.0)
+    assert window.maximum() == (60, 12.0)
+    # Samples exactly 120s old still count, older ones are evicted
+    window.push(180, 11.5)
+    assert window.minimum() == (120, 11.0)
+    assert window.maximum() == (60, 12.0)
+    assert window.move(180, 11.5) == pytest.approx((50 / 11, 60))
+
+def test_window_move_picks_the_larger_direction():
+    window = WindowExtrema(300)
+    for timestamp, price in [(0, 100.0), (10, 90.0), (20, 99.0)]:
+        window.push(timestamp, price)
+    change, seconds = window.move(20, 99.0)
+    assert change == pytest.approx(10.0)
+    assert seconds == 10
+    window.reset(30, 50.0)
+    assert window.minimum() == window.maximum() == (30, 50.0)